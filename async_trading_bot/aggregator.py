@@ -0,0 +1,114 @@
+from async_trading_bot.utils import INTERVAL_MS, MINUTE_MS
+
+WEEK_OFFSET_MS = 4 * 1440 * MINUTE_MS  # Weekly klines open on Monday 00:00 UTC, the epoch was a Thursday
+
+
+def candle_open_time(open_time, interval):
+    """Open time of the `interval` candle holding the 1m candle that opens at `open_time` (UTC aligned)."""
+    interval_ms = INTERVAL_MS[interval]
+    offset = WEEK_OFFSET_MS if interval == '1w' else 0
+    return (open_time - offset) // interval_ms * interval_ms + offset
+
+
+class _Candle:
+    """Open candle of one interval, made of the latest snapshot of each of its 1m candles."""
+
+    def __init__(self, open_time, interval):
+        self.open_time = open_time
+        self.interval = interval
+        self.minutes = {}  # 1m open time -> (open, high, low, close, volume)
+        self.before_last = None  # Aggregate of the minutes before the last one, reused while the last one updates
+        self.stale = False  # before_last has to be aggregated again after a late update
+        self.last_minute = None
+
+    def update(self, minute, ohlcv):
+        if self.last_minute is None or minute > self.last_minute:
+            if self.last_minute is not None and not self.stale:
+                self.before_last = _merge(self.before_last, self.minutes[self.last_minute])
+            self.last_minute = minute
+        elif minute < self.last_minute:
+            self.stale = True
+        self.minutes[minute] = ohlcv
+
+    def ohlcv(self):
+        if self.stale:
+            self.before_last = None
+            for minute in sorted(self.minutes):
+                if minute < self.last_minute:
+                    self.before_last = _merge(self.before_last, self.minutes[minute])
+            self.stale = False
+        return _merge(self.before_last, self.minutes[self.last_minute])
+
+    @property
+    def complete(self):
+        """Whether every 1m candle of the interval was seen, i.e. open, high, low and volume are exact."""
+        return len(self.minutes) == INTERVAL_MS[self.interval] // MINUTE_MS
+
+    def kline(self, closed):
+        open_, high, low, close, volume = self.ohlcv()
+        return {'t': self.open_time, 'T': self.open_time + INTERVAL_MS[self.interval] - 1, 'i': self.interval,
+                'o': open_, 'h': high, 'l': low, 'c': close, 'v': volume, 'x': closed, 'complete': self.complete}
+
+
+def _merge(first, second):
+    if first is None:
+        return second
+    return first[0], max(first[1], second[1]), min(first[2], second[2]), second[3], first[4] + second[4]
+
+
+class CandleAggregator:
+    """
+    Builds candles of any fixed interval (5m, 15m, 1h, 4h, 1d, ...) from the 1m kline stream, so every interval a
+    bot needs costs no extra stream or REST request.
+
+    Candles are aligned to UTC like Binance klines. A 1m update replaces the earlier snapshot of its minute, so
+    repeated and late updates within the open candle are counted once. Updates for a candle that is already
+    closed are ignored. A candle closes with the close of its last minute, or when a minute of the next candle
+    arrives first. Candles whose minutes were not all seen (e.g. the first one after a start) are flagged as not
+    `complete`: only their close is exact.
+    """
+
+    def __init__(self, intervals=()):
+        self.candles = {}  # interval -> _Candle that is open
+        self.last_closed = {}  # interval -> open time of the last closed candle
+        self.late_updates = 0
+        for interval in intervals:
+            self.add_interval(interval)
+
+    def add_interval(self, interval):
+        if interval not in INTERVAL_MS:
+            raise ValueError(f"Unsupported interval {interval}, expected one of {', '.join(INTERVAL_MS)}.")
+        if interval != '1m':
+            self.candles.setdefault(interval, None)
+
+    @property
+    def intervals(self):
+        return list(self.candles)
+
+    def on_kline(self, kline):
+        """
+        Feed a 1m kline payload ('k' of a kline event). Returns the kline payloads of the aggregated intervals it
+        changed, closed ones before the update of the candle that follows them.
+        """
+        minute = int(kline['t'])
+        ohlcv = (float(kline['o']), float(kline['h']), float(kline['l']), float(kline['c']), float(kline['v']))
+        minute_closed = kline['x']
+        updates = []
+        for interval, candle in self.candles.items():
+            open_time = candle_open_time(minute, interval)
+            if open_time <= self.last_closed.get(interval, -1):
+                self.late_updates += 1
+                continue
+            if candle is not None and open_time > candle.open_time:
+                updates.append(candle.kline(True))  # The close of its last minute was missed
+                self.last_closed[interval] = candle.open_time
+                candle = None
+            if candle is None:
+                candle = self.candles[interval] = _Candle(open_time, interval)
+            candle.update(minute, ohlcv)
+            closed = minute_closed and minute + MINUTE_MS == open_time + INTERVAL_MS[interval]
+            updates.append(candle.kline(closed))
+            if closed:
+                self.last_closed[interval] = open_time
+                self.candles[interval] = None
+        return updates
@@ -0,0 +1,207 @@
+import argparse
+import json
+import numpy as np
+import talib
+from async_trading_bot.aggregator import candle_open_time
+from async_trading_bot.trailing import TRIGGER_STEP
+
+DEFAULT_FEE = 0.0004  # Binance futures taker fee, paid on entry and exit
+DEFAULT_SLIPPAGE = 0.0002  # Adverse price move on every market fill
+KLINE_COLUMNS = ('open_time', 'open', 'high', 'low', 'close')
+
+
+def load_csv_klines(path):
+    """1m klines from a Binance kline CSV (open_time, open, high, low, close, ...), header row optional."""
+    with open(path) as file:
+        has_header = not file.readline()[:1].isdigit()
+    data = np.loadtxt(path, delimiter=',', usecols=range(5), skiprows=int(has_header), ndmin=2)
+    klines = {name: np.ascontiguousarray(data[:, i]) for i, name in enumerate(KLINE_COLUMNS)}
+    klines['open_time'] = klines['open_time'].astype(np.int64)
+    return klines
+
+
+def load_store_klines(store):
+    """1m klines from a KlineStore, the columns are zero-copy memory mapped views."""
+    return {name: store.column(name) for name in KLINE_COLUMNS}
+
+
+def candle_index(open_time, interval):
+    """For 1m bars: index of the last bar of every `interval` candle and the candle number of every bar."""
+    bucket = candle_open_time(open_time, interval)
+    new_candle = np.diff(bucket) != 0
+    last_bar = np.append(np.flatnonzero(new_candle), len(bucket) - 1)
+    candle_of_bar = np.concatenate(([0], np.cumsum(new_candle)))
+    return last_bar, candle_of_bar
+
+
+def crossover_entries(klines, short_period, long_period, interval, intra_candle=False):
+    """
+    Bars where EmaCrossoverStrategy opens a position and the side (+1 BUY, -1 SELL) it opens.
+
+    The EMAs are talib.EMA over the `interval` candle closes. On candle close mode the crossover is evaluated at
+    the last 1m bar of every candle, in intra candle mode at every 1m bar with the open candle's close being the
+    bar close, exactly like the streaming EmaEngine. An entry happens wherever the side differs from the last
+    opened side (the strategy's last_action gating).
+    """
+    last_bar, _ = candle_index(klines['open_time'], interval)
+    candle_close = np.ascontiguousarray(klines['close'][last_bar], dtype=np.float64)
+    return crossover_entries_from_ema(klines, talib.EMA(candle_close, short_period), short_period,
+                                      talib.EMA(candle_close, long_period), long_period, interval, intra_candle)
+
+
+def crossover_entries_from_ema(klines, short_candle_ema, short_period, long_candle_ema, long_period, interval,
+                               intra_candle=False):
+    """crossover_entries with the candle EMAs already computed, e.g. by the optimizer's batched ema_matrix."""
+    close = klines['close']
+    last_bar, candle_of_bar = candle_index(klines['open_time'], interval)
+    short_ema = _ema_at_bars(short_candle_ema, short_period, close, last_bar, candle_of_bar, intra_candle)
+    long_ema = _ema_at_bars(long_candle_ema, long_period, close, last_bar, candle_of_bar, intra_candle)
+    desired = np.sign(np.nan_to_num(short_ema - long_ema, nan=0.0))
+    bars = np.flatnonzero(desired)
+    sides = desired[bars]
+    changed = np.concatenate(([True], sides[1:] != sides[:-1])) if len(sides) else np.zeros(0, dtype=bool)
+    return bars[changed], sides[changed].astype(np.int64)
+
+
+def _ema_at_bars(candle_ema, period, close, last_bar, candle_of_bar, intra_candle):
+    """EMA seen at every 1m bar, NaN where the strategy does not evaluate."""
+    if intra_candle:
+        # Provisional EMA of the open candle: committed EMA of the previous candle updated with the bar close
+        previous = candle_of_bar - 1
+        committed = np.where(previous >= 0, candle_ema[np.maximum(previous, 0)], np.nan)
+        return ((close - committed) * (2.0 / (period + 1))) + committed
+    values = np.full(len(close), np.nan)
+    values[last_bar] = candle_ema
+    return values
+
+
+def _first(mask):
+    index = int(np.argmax(mask)) if len(mask) else 0
+    return index if len(mask) and mask[index] else None
+
+
+class BacktestResult:
+    def __init__(self, open_time, equity, trades, initial_balance):
+        self.open_time = open_time
+        self.equity = equity
+        self.drawdown = equity / np.maximum.accumulate(equity) - 1
+        self.trades = trades
+        self.initial_balance = initial_balance
+
+    def summary(self):
+        pnl = np.array([trade['pnl'] for trade in self.trades])
+        gains, losses = pnl[pnl > 0].sum(), -pnl[pnl < 0].sum()
+        return {
+            'final_equity': float(self.equity[-1]) if len(self.equity) else self.initial_balance,
+            'return': float(self.equity[-1] / self.initial_balance - 1) if len(self.equity) else 0.0,
+            'max_drawdown': float(self.drawdown.min()) if len(self.drawdown) else 0.0,
+            'trades': len(self.trades),
+            'win_rate': float((pnl > 0).mean()) if len(pnl) else 0.0,
+            'profit_factor': float(gains / losses) if losses else float('inf'),
+            'fees': float(sum(trade['fees'] for trade in self.trades)),
+        }
+
+
+def backtest(klines, config, initial_balance=1000.0, fee=DEFAULT_FEE, slippage=DEFAULT_SLIPPAGE, entries=None):
+    """
+    Replay TradingBot on 1m klines with the config's short/long EMA periods, ema_interval, risk_percentage,
+    price_increase_trigger, leverage and order_size (percent of the balance, as in calculate_quantity).
+
+    Per position: the entry stop sits risk_percentage from the fill price. Once a 1m close is
+    price_increase_trigger beyond the entry, the stop moves to risk_percentage from that close and the trigger
+    grows by TRIGGER_STEP. The position ends at the stop, at the next crossover or at the end of the data. Stop
+    and liquidation hits are detected on the bar high/low, a gap through the stop fills at the bar open.
+
+    `entries` are precomputed (bars, sides) from crossover_entries, computed from the config when not given.
+    """
+    open_time, open_, high, low, close = (klines[name] for name in KLINE_COLUMNS)
+    if entries is None:
+        entries = crossover_entries(klines, config['short_ema_period'], config['long_ema_period'],
+                                    config['ema_interval'], config.get('intra_candle', False))
+    entries, sides = entries
+    risk = config['risk_percentage']
+    leverage = config['leverage']
+    n = len(close)
+    cash = initial_balance
+    cash_change = np.zeros(n)
+    unrealized = np.zeros(n)
+    trades = []
+    for t in range(len(entries)):
+        start, side = int(entries[t]), int(sides[t])
+        end = int(entries[t + 1]) if t + 1 < len(entries) else n - 1
+        entry_price = close[start] * (1 + side * slippage)
+        quantity = config['order_size'] / 100 * cash / close[start]
+        entry_fee = quantity * entry_price * fee
+        stop = entry_price * (1 - side * risk)
+        liquidation = entry_price * (1 - side / leverage)
+        reason = 'stop'
+        if side * (liquidation - stop) > 0:
+            stop, reason = liquidation, 'liquidation'
+        trigger = config['price_increase_trigger']
+        exit_bar, exit_price = end, close[end]
+        exit_reason = 'reverse' if t + 1 < len(entries) else 'end'
+        stop_moves = 0
+        i = start + 1
+        # Jump from one stop hit / trailing trigger to the next with vectorized searches
+        while i <= end:
+            if side > 0:
+                hit = _first(low[i:end + 1] <= stop)
+                moved = _first(close[i:end + 1] >= entry_price * (1 + trigger))
+            else:
+                hit = _first(high[i:end + 1] >= stop)
+                moved = _first(close[i:end + 1] <= entry_price * (1 - trigger))
+            if hit is not None and (moved is None or hit <= moved):
+                exit_bar = i + hit
+                exit_price = min(stop, open_[exit_bar]) if side > 0 else max(stop, open_[exit_bar])
+                exit_reason = reason
+                break
+            if moved is None:
+                break
+            bar = i + moved
+            new_stop = close[bar] * (1 - side * risk)
+            if side * (new_stop - stop) > 0:  # Like the live ratchet, the stop only moves in the trade's favour
+                stop, reason = new_stop, 'stop'
+                stop_moves += 1
+            trigger += TRIGGER_STEP
+            i = bar + 1
+        exit_price *= (1 - side * slippage)
+        pnl = side * quantity * (exit_price - entry_price)
+        fees = entry_fee + quantity * exit_price * fee
+        cash += pnl - fees
+        cash_change[exit_bar] += pnl - fees
+        unrealized[start:exit_bar] = side * quantity * (close[start:exit_bar] - entry_price) - entry_fee
+        trades.append({'side': 'BUY' if side > 0 else 'SELL', 'entry_time': int(open_time[start]),
+                       'exit_time': int(open_time[exit_bar]), 'entry_price': float(entry_price),
+                       'exit_price': float(exit_price), 'quantity': float(quantity), 'pnl': float(pnl - fees),
+                       'fees': float(fees), 'exit_reason': exit_reason, 'stop_moves': stop_moves})
+    equity = initial_balance + np.cumsum(cash_change) + unrealized
+    return BacktestResult(open_time, equity, trades, initial_balance)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the EMA crossover bot on 1m klines")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--csv', help="Binance 1m kline CSV")
+    parser.add_argument('--store', help="kline store directory, uses the config symbol's 1m klines")
+    parser.add_argument('--balance', type=float, default=1000.0)
+    parser.add_argument('--fee', type=float, default=DEFAULT_FEE)
+    parser.add_argument('--slippage', type=float, default=DEFAULT_SLIPPAGE)
+    parser.add_argument('--trades', action='store_true', help="print every trade")
+    args = parser.parse_args()
+    with open(args.config) as file:
+        config = json.load(file)
+    if args.csv:
+        klines = load_csv_klines(args.csv)
+    else:
+        from async_trading_bot.kline_store import KlineStore
+        klines = load_store_klines(KlineStore(args.store or config.get('kline_store_dir', 'klines'),
+                                              config['symbol'], '1m'))
+    result = backtest(klines, config, args.balance, args.fee, args.slippage)
+    if args.trades:
+        for trade in result.trades:
+            print(trade)
+    print(json.dumps(result.summary(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
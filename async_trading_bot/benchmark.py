@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+import aiohttp
+from async_trading_bot.metrics import metrics
+from async_trading_bot.runner import MultiSymbolRunner
+from async_trading_bot.simulator import add_arguments, exchange_from_args
+
+
+def _serve(args):
+    asyncio.run(exchange_from_args(args).serve(args.host, args.port))
+
+
+def simulator_config(config, args, symbols):
+    """The bot config pointed at the simulator, trading the replayed symbols."""
+    # Keep recorded candles and simulated fills out of the live kline store and journal
+    config = {key: value for key, value in config.items() if key not in ('kline_store_dir', 'journal_dir')}
+    config.update(rest_url=f"http://{args.host}:{args.port}", ws_url=f"ws://{args.host}:{args.port}")
+    if 'symbols' not in config and config.get('symbol') not in symbols:
+        config['symbols'] = list(symbols)
+    return config
+
+
+def market_events():
+    """(processed, coalesced away) market events of the bots in this process."""
+    processed = sum(h.count for (name, _), h in metrics.histograms.items() if name == 'ws_process_seconds')
+    dropped = sum(value for (name, _), value in metrics.counters.items() if name == 'ws_dropped_events')
+    return processed, dropped
+
+
+async def run_benchmark(config, stats_url, duration):
+    """
+    Run the bot against the simulator until the replay ended and the bot handled all of it, or `duration` seconds
+    passed. Returns the simulator stats and the seconds from the start of the replay to the last handled event.
+    """
+    runner = MultiSymbolRunner('simulator', 'simulator', config)
+    last_event = 0.0
+
+    def track(handle):
+        async def handle_market_event(data):
+            nonlocal last_event
+            await handle(data)
+            last_event = time.time()
+        return handle_market_event
+
+    for trading_bot in runner.bots:
+        trading_bot.handle_market_event = track(trading_bot.handle_market_event)
+    bot = asyncio.create_task(runner.run())
+    started = time.monotonic()
+    stats, handled = {}, None
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() - started < duration:
+            await asyncio.sleep(1)
+            if bot.done():
+                bot.result()  # Raises what stopped the bot
+            async with session.get(stats_url) as response:
+                stats = await response.json()
+            if stats['finished']:
+                # Stop once the bot went a second without handling a market event
+                if market_events() == handled:
+                    break
+                handled = market_events()
+    bot.cancel()
+    await asyncio.gather(bot, return_exceptions=True)
+    if not stats.get('finished'):
+        return stats, None
+    return stats, last_event - (stats['replay_finished'] - stats['elapsed_seconds'])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Tick-to-trade latency and throughput of the bot against the local exchange simulator")
+    add_arguments(parser)
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--duration', type=float, default=300, help="stop after this many seconds")
+    args = parser.parse_args()
+    with open(args.config) as file:
+        config = json.load(file)
+    symbols = [item.split('=', 1)[0] for item in args.csv] + args.symbols
+
+    simulator = multiprocessing.Process(target=_serve, args=(args,), daemon=True)
+    simulator.start()
+    try:
+        time.sleep(1)  # Let the simulator bind its port
+        stats, bot_seconds = asyncio.run(run_benchmark(simulator_config(config, args, symbols),
+                                                       f"http://{args.host}:{args.port}/sim/stats", args.duration))
+    finally:
+        simulator.terminate()
+    print("Simulator:")
+    print(json.dumps(stats, indent=2))
+    print("Bot:")
+    print(metrics.summary())
+    processed, dropped = market_events()
+    rate = f"{processed / bot_seconds:.0f}/s over {bot_seconds:.2f} s" if bot_seconds else "replay not finished"
+    print(f"Market events processed: {processed} ({rate}), coalesced away: {dropped}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import math
+
+
+class StreamingEMA:
+    """
+    Exponential moving average updated one value at a time.
+
+    Uses the same definition as talib.EMA: the first value is the simple average of the first `period`
+    closes, every following value is prev + k * (close - prev) with k = 2 / (period + 1).
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.value = math.nan  # EMA after the last committed (closed) value
+        self._count = 0
+        self._sum = 0.0
+
+    @property
+    def ready(self):
+        return self._count >= self.period
+
+    def commit(self, close):
+        """Add a closed value and return the new EMA."""
+        self.value = self.peek(close)
+        self._count += 1
+        if self._count <= self.period:
+            self._sum += close
+        return self.value
+
+    def peek(self, close):
+        """Return the EMA as if `close` was committed, without changing the state."""
+        if self._count + 1 < self.period:
+            return math.nan
+        if self._count + 1 == self.period:
+            return (self._sum + close) / self.period
+        return ((close - self.value) * self.k) + self.value
+
+
+class EmaEngine:
+    """
+    Short/long EMA pair for one kline interval.
+
+    Seeded once from historical klines and then fed from the kline websocket. Closed candles are committed,
+    updates of the still open candle only change the provisional value, so each message costs O(1).
+    """
+
+    def __init__(self, short_period, long_period):
+        self.short = StreamingEMA(short_period)
+        self.long = StreamingEMA(long_period)
+        self.short_ema = math.nan
+        self.long_ema = math.nan
+        self.last_closed_time = None  # open time of the last committed candle
+        self._pending = None  # (open_time, close) of the candle that is still open
+
+    @property
+    def ready(self):
+        return not (math.isnan(self.short_ema) or math.isnan(self.long_ema))
+
+    def values(self):
+        return self.short_ema, self.long_ema
+
+    def seed(self, klines):
+        """
+        Seed from REST klines (futures_klines format). The last kline returned by Binance is the candle that is
+        still open, it is kept as provisional so the values match talib.EMA over the full close list.
+        """
+        self.__init__(self.short.period, self.long.period)
+        for k in klines[:-1]:
+            self._commit(int(k[0]), float(k[4]))
+        if klines:
+            self.on_kline(int(klines[-1][0]), float(klines[-1][4]), False)
+
+    def seed_closed(self, open_times, closes):
+        """Seed from closed candles only (e.g. a KlineStore), the open candle follows from the websocket."""
+        self.__init__(self.short.period, self.long.period)
+        for open_time, close in zip(open_times.tolist(), closes.tolist()):
+            self._commit(open_time, close)
+
+    def on_kline(self, open_time, close, closed):
+        if self.last_closed_time is not None and open_time <= self.last_closed_time:
+            return  # Late message for a candle that is already committed
+        if self._pending is not None and open_time > self._pending[0]:
+            # The close message of the previous candle was missed, commit its last known close
+            self._commit(*self._pending)
+        if closed:
+            self._commit(open_time, close)
+        else:
+            self._pending = (open_time, close)
+            self.short_ema = self.short.peek(close)
+            self.long_ema = self.long.peek(close)
+
+    def _commit(self, open_time, close):
+        self.short_ema = self.short.commit(close)
+        self.long_ema = self.long.commit(close)
+        self.last_closed_time = open_time
+        self._pending = None
@@ -0,0 +1,344 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+import ujson
+from async_trading_bot.user_stream import SNAPSHOT_TOLERANCE_MS
+
+SEGMENT_PREFIX = 'journal-'
+SEGMENT_SUFFIX = '.jsonl'
+RECENT_TRADES = 256  # Trade ids remembered per symbol, a fill seen twice (stream and REST catch-up) counts once
+ACCOUNT_TRADES_LIMIT = 1000  # Maximum trades per futures_account_trades request
+ACCOUNT_TRADES_WINDOW = 7 * 24 * 3600 * 1000  # Longest startTime-endTime range of futures_account_trades, in ms
+
+
+def segments(directory):
+    """Journal files of `directory`, oldest first."""
+    if not directory or not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+    return [os.path.join(directory, name) for name in names]
+
+
+def read_events(directory):
+    """
+    Events of the journal in `directory`, from the newest snapshot on. A line torn by a crash during a write is
+    skipped.
+    """
+    paths = segments(directory)
+    start = 0
+    for index in range(len(paths) - 1, -1, -1):
+        with open(paths[index], 'rb') as file:
+            first = file.readline()
+        if first.startswith(b'{"type":"snapshot"'):
+            start = index
+            break
+    for path in paths[start:]:
+        with open(path, 'rb') as file:
+            for line in file:
+                try:
+                    yield ujson.loads(line)
+                except ValueError:
+                    continue
+
+
+class TradeJournal:
+    """
+    Append-only JSON lines journal of orders, fills, stop moves and signals.
+
+    record() only queues the event. A background task writes the queued events every `flush_interval` seconds
+    in one batch from a worker thread, so the event loop never waits for the disk. Once a file grew beyond
+    `max_bytes` the next one starts with a snapshot of the state after the last batch (see Ledger.snapshot), so a
+    rebuild only reads the newest file and the oldest ones can be dropped: `keep` files are kept, 0 keeps all of
+    them. Without a directory nothing is written.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, keep=0, flush_interval=0.5):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.flush_interval = flush_interval
+        self.snapshot = None  # Callable returning the state to write at the start of every new file
+        self.written = 0
+        self._pending = []
+        self._path = None
+        self._size = 0
+        self._task = None
+        self._write_lock = threading.Lock()  # A flush from close() may overlap the write of a cancelled one
+
+    def record(self, type_, **fields):
+        """Queue an event, returns immediately. The dicts in `fields` must not be changed afterwards."""
+        if not self.enabled:
+            return
+        self._pending.append({'type': type_, 'ts': int(time.time() * 1000), **fields})
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        events, self._pending = self._pending, []
+        # Taken together with the batch, so it covers exactly the events written before it
+        snapshot = self.snapshot() if self.snapshot else None
+        try:
+            await asyncio.to_thread(self._write, events, snapshot)
+        except OSError as e:
+            print(f"Failed to write {len(events)} journal events: {e}")
+            self._pending[:0] = events  # Retried with the next batch
+            return
+        self.written += len(events)
+
+    def _write(self, events, snapshot):
+        with self._write_lock:
+            if self._path is None:
+                os.makedirs(self.directory, exist_ok=True)
+                paths = segments(self.directory)
+                if paths:
+                    self._path, self._size = paths[-1], os.path.getsize(paths[-1])
+                else:
+                    self._new_segment(None)  # A rebuild reads the first file from its start
+            data = ''.join(ujson.dumps(event) + '\n' for event in events).encode()
+            with open(self._path, 'ab') as file:
+                file.write(data)
+            self._size += len(data)
+            if self._size >= self.max_bytes:
+                self._new_segment(snapshot)
+
+    def _new_segment(self, snapshot):
+        index = 1
+        paths = segments(self.directory)
+        if paths:
+            index = int(os.path.basename(paths[-1])[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) + 1
+        self._path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{index:06d}{SEGMENT_SUFFIX}")
+        data = b''
+        if snapshot is not None:
+            data = (ujson.dumps({'type': 'snapshot', 'ts': int(time.time() * 1000), 'state': snapshot}) + '\n').encode()
+        with open(self._path, 'ab') as file:
+            file.write(data)
+        self._size = len(data)
+        if self.keep:
+            for path in segments(self.directory)[:-self.keep]:
+                os.remove(path)
+
+    async def close(self):
+        """Write what is still queued and stop the writer."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+class Ledger:
+    """
+    Realized and unrealized PnL, fees and funding per symbol, from the fills and funding payments of the user
+    data stream.
+
+    Positions are one-way (positionSide BOTH) at their average entry price, like Binance computes the realized
+    PnL. Fees paid in another asset than `asset` (e.g. BNB) are kept apart in `other_fees`. Funding of crossed
+    positions comes without a symbol and is booked on the only open position, or on '' with none or several
+    open. Every fill and funding payment is recorded in the journal, load() replays it to rebuild the ledger.
+    """
+
+    def __init__(self, journal=None, asset='USDT'):
+        self.journal = journal or TradeJournal(None)
+        self.journal.snapshot = self.snapshot
+        self.asset = asset
+        self.symbols = {}  # symbol -> state, see _state
+        self.trade_ids = {}  # symbol -> deque of recent trade ids
+        self.recent_fills = {}  # symbol -> deque of (trade time, signed quantity) of recent fills, for reconcile
+
+    @staticmethod
+    def _state():
+        return {'amount': 0.0, 'entry_price': 0.0, 'realized': 0.0, 'fees': 0.0, 'other_fees': {},
+                'funding': 0.0, 'last_trade_time': 0}
+
+    def state(self, symbol):
+        state = self.symbols.get(symbol)
+        if state is None:
+            state = self.symbols[symbol] = self._state()
+        return state
+
+    # Live events
+
+    def on_order_update(self, order):
+        """AccountState order listener, books every trade execution."""
+        if order['x'] != 'TRADE' or float(order['l']) == 0:
+            return
+        self.record_fill(order['s'], order['S'], float(order['l']), float(order['L']), float(order.get('n', 0)),
+                         order.get('N', self.asset), order['i'], order.get('t'), order.get('T'))
+
+    def on_account_update(self, update):
+        """AccountState ACCOUNT_UPDATE listener, books funding payments."""
+        if update.get('m') != 'FUNDING_FEE':
+            return
+        positions = update.get('P') or []
+        if positions:
+            symbol = positions[0]['s']
+        else:
+            open_symbols = [symbol for symbol, state in self.symbols.items() if state['amount'] != 0]
+            symbol = open_symbols[0] if len(open_symbols) == 1 else ''
+        for balance in update.get('B', []):
+            if balance['a'] == self.asset and float(balance['bc']) != 0:
+                self._record({'type': 'funding', 'symbol': symbol, 'amount': float(balance['bc'])})
+
+    def record_fill(self, symbol, side, quantity, price, fee, fee_asset, order_id, trade_id=None, trade_time=None):
+        if trade_id is not None and trade_id in self.trade_ids.get(symbol, ()):
+            return
+        self._record({'type': 'fill', 'symbol': symbol, 'side': side, 'qty': quantity, 'price': price, 'fee': fee,
+                      'fee_asset': fee_asset, 'order_id': order_id, 'trade_id': trade_id, 'time': trade_time})
+
+    def _record(self, event):
+        self.apply(event)
+        fields = dict(event)
+        self.journal.record(fields.pop('type'), **fields)
+
+    # State
+
+    def apply(self, event):
+        type_ = event['type']
+        if type_ == 'fill':
+            self._apply_fill(event)
+        elif type_ == 'funding':
+            self.state(event['symbol'])['funding'] += event['amount']
+        elif type_ == 'adjust':
+            self.state(event['symbol']).update(amount=event['amount'], entry_price=event['entry_price'])
+        elif type_ == 'snapshot':
+            self.restore(event['state'])
+
+    def _apply_fill(self, fill):
+        state = self.state(fill['symbol'])
+        quantity, price = fill['qty'], fill['price']
+        signed = quantity if fill['side'] == 'BUY' else -quantity
+        amount, entry = state['amount'], state['entry_price']
+        new_amount = amount + signed
+        if amount * signed < 0:
+            state['realized'] += min(abs(amount), quantity) * (price - entry) * (1 if amount > 0 else -1)
+            if abs(new_amount) < 1e-12:
+                new_amount, entry = 0.0, 0.0
+            elif new_amount * amount < 0:
+                entry = price  # Flipped, the rest is a new position at the fill price
+        else:
+            entry = (abs(amount) * entry + quantity * price) / abs(new_amount)
+        state.update(amount=new_amount, entry_price=entry)
+        if fill['fee_asset'] == self.asset:
+            state['fees'] += fill['fee']
+        else:
+            state['other_fees'][fill['fee_asset']] = state['other_fees'].get(fill['fee_asset'], 0.0) + fill['fee']
+        if fill.get('time'):
+            state['last_trade_time'] = max(state['last_trade_time'], fill['time'])
+        if fill.get('trade_id') is not None:
+            self.trade_ids.setdefault(fill['symbol'], deque(maxlen=RECENT_TRADES)).append(fill['trade_id'])
+        if fill.get('time'):
+            self.recent_fills.setdefault(fill['symbol'], deque(maxlen=RECENT_TRADES)).append((fill['time'], signed))
+
+    def snapshot(self):
+        """Copy of the state, it is serialized by the journal writer thread."""
+        symbols = {symbol: {**state, 'other_fees': dict(state['other_fees'])} for symbol, state in self.symbols.items()}
+        return {'symbols': symbols, 'trade_ids': {symbol: list(ids) for symbol, ids in self.trade_ids.items()}}
+
+    def restore(self, state):
+        self.symbols = {symbol: {**self._state(), **values} for symbol, values in state['symbols'].items()}
+        self.trade_ids = {symbol: deque(ids, maxlen=RECENT_TRADES) for symbol, ids in state['trade_ids'].items()}
+
+    def unrealized(self, symbol, price):
+        state = self.symbols.get(symbol)
+        if state is None or state['amount'] == 0:
+            return 0.0
+        return state['amount'] * (price - state['entry_price'])
+
+    def summary(self, symbol, price=None):
+        """PnL figures of a symbol, unrealized at `price` (e.g. the mark price) when given."""
+        state = self.symbols.get(symbol) or self._state()
+        unrealized = self.unrealized(symbol, price) if price is not None else 0.0
+        net = state['realized'] - state['fees'] + state['funding']
+        return {'amount': state['amount'], 'entry_price': state['entry_price'], 'realized': state['realized'],
+                'unrealized': unrealized, 'fees': state['fees'], 'other_fees': dict(state['other_fees']),
+                'funding': state['funding'], 'net': net, 'net_with_unrealized': net + unrealized}
+
+    # Startup
+
+    async def load(self):
+        """Rebuild from the journal in a worker thread, only the newest snapshot and what follows it are read."""
+        if self.journal.enabled:
+            await asyncio.to_thread(self._replay, self.journal.directory)
+
+    def _replay(self, directory):
+        for event in read_events(directory):
+            self.apply(event)
+
+    async def catch_up(self, client, symbols, end_time=None, since=None):
+        """
+        Book the fills of `symbols` made up to `end_time` (ms, server clock, default now) that are not journaled
+        yet, e.g. while the bot was not running, from the account trade list. Symbols without journaled fills are
+        read from `since` on, or skipped without it.
+
+        The list is read in windows of at most 7 days, the longest range Binance accepts. A full page is
+        followed by id (fromId cannot be combined with a time range), so any number of trades in one
+        millisecond is read once.
+        """
+        if end_time is None:
+            end_time = int(time.time() * 1000 + getattr(client, 'timestamp_offset', 0))
+        for symbol in symbols:
+            state = self.symbols.get(symbol)
+            # Trades of the millisecond of the last booked one are read again and skipped by id
+            start_time = state['last_trade_time'] if state and state['last_trade_time'] else since
+            if start_time is None:
+                continue  # Nothing journaled for it, reconcile() takes over the position
+            while start_time <= end_time:
+                window_end = min(start_time + ACCOUNT_TRADES_WINDOW - 1, end_time)
+                trades = await client.futures_account_trades(symbol=symbol, startTime=start_time,
+                                                             endTime=window_end, limit=ACCOUNT_TRADES_LIMIT)
+                while True:
+                    for trade in trades:
+                        if trade['time'] <= window_end:
+                            self.record_fill(symbol, trade['side'], float(trade['qty']), float(trade['price']),
+                                             float(trade['commission']), trade['commissionAsset'],
+                                             trade['orderId'], trade['id'], trade['time'])
+                    if len(trades) < ACCOUNT_TRADES_LIMIT or trades[-1]['time'] > window_end:
+                        break
+                    trades = await client.futures_account_trades(symbol=symbol, fromId=trades[-1]['id'] + 1,
+                                                                 limit=ACCOUNT_TRADES_LIMIT)
+                start_time = window_end + 1
+
+    def reconcile(self, account, symbols):
+        """
+        Adopt the position of an account snapshot for symbols whose journaled position differs from it. Fills
+        booked after the last position change of the snapshot (its updateTime) are not in it and are kept.
+        """
+        for symbol in symbols:
+            amount = account.position_amount(symbol)
+            state = self.state(symbol)
+            update_time = account.position_update_time(symbol)
+            later = 0.0
+            if update_time is not None:
+                later = sum(signed for time_, signed in self.recent_fills.get(symbol, ()) if time_ > update_time)
+            if abs(state['amount'] - later - amount) < 1e-9:
+                continue
+            entry_price, _ = account.position(symbol, 'BOTH')
+            print(f"Ledger position of {symbol} is {state['amount'] - later}, the exchange has {amount}. "
+                  f"Using the latter.")
+            self._record({'type': 'adjust', 'symbol': symbol, 'amount': amount + later,
+                          'entry_price': entry_price or 0.0})
+
+    async def sync(self, client, symbols, account, snapshot_time):
+        """
+        UserDataStream sync listener: after every account snapshot, book the fills missed up to now (e.g. while
+        the stream was disconnected) and adopt its positions. The stream applies events from SNAPSHOT_TOLERANCE_MS
+        before the snapshot on, so fills of that window are booked from the trade list as well, also for symbols
+        without journaled fills: the stream's copy of them is then skipped by trade id. Later fills come from the
+        stream events.
+        """
+        try:
+            await self.catch_up(client, symbols, since=snapshot_time - SNAPSHOT_TOLERANCE_MS)
+        except Exception as e:
+            print(f"Failed to catch up the ledger with the account trades: {e}")
+        if account.synced:
+            self.reconcile(account, symbols)
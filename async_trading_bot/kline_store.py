@@ -0,0 +1,105 @@
+import os
+import time
+import numpy as np
+from async_trading_bot.utils import INTERVAL_MS
+
+# One raw little-endian file per column, row i of every file is the same candle
+COLUMNS = (('open_time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+           ('volume', '<f8'), ('close_time', '<i8'))
+KLINES_PER_REQUEST = 1500  # futures_klines maximum limit
+
+
+class KlineStore:
+    """
+    Closed klines of one symbol/interval on disk, stored column by column as fixed-width NumPy arrays.
+
+    The columns are memory mapped, so reading history is a file map and slices of `column()` are zero-copy views.
+    New candles are appended from the kline websocket, gaps (downtime, reconnects) are back-filled with paged
+    futures_klines requests.
+    """
+
+    def __init__(self, directory, symbol, interval):
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.path = os.path.join(directory, f"{symbol}_{interval}")
+        os.makedirs(self.path, exist_ok=True)
+        self._columns = {}
+        self._truncate_partial_rows()
+        self._map()
+
+    def _file(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _truncate_partial_rows(self):
+        # An interrupted append can leave some columns one row longer than others
+        rows = min(self._file_rows(name, dtype) for name, dtype in COLUMNS)
+        for name, dtype in COLUMNS:
+            if self._file_rows(name, dtype) != rows:
+                os.truncate(self._file(name), rows * np.dtype(dtype).itemsize)
+
+    def _file_rows(self, name, dtype):
+        path = self._file(name)
+        return os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0
+
+    def _map(self):
+        for name, dtype in COLUMNS:
+            if self._file_rows(name, dtype):
+                self._columns[name] = np.memmap(self._file(name), dtype=dtype, mode='r')
+            else:
+                self._columns[name] = np.empty(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self._columns['open_time'])
+
+    @property
+    def last_open_time(self):
+        return int(self._columns['open_time'][-1]) if len(self) else None
+
+    def column(self, name, limit=None):
+        """Zero-copy view of a column, the last `limit` rows if given."""
+        data = self._columns[name]
+        return data[-limit:] if limit else data
+
+    def closes(self, limit=None):
+        return self.column('close', limit)
+
+    def expects(self, open_time):
+        """True if a candle opening at `open_time` can be appended without leaving a gap."""
+        last = self.last_open_time
+        return last is None or open_time == last + self.interval_ms
+
+    def append(self, rows):
+        """Append closed candles given as tuples in COLUMNS order. Candles that are already stored are skipped."""
+        last = self.last_open_time
+        rows = [row for row in rows if last is None or row[0] > last]
+        if not rows:
+            return
+        values = list(zip(*rows))
+        for (name, dtype), column in zip(COLUMNS, values):
+            with open(self._file(name), 'ab') as file:
+                file.write(np.asarray(column, dtype=dtype).tobytes())
+        self._map()
+
+    def append_ws_kline(self, kline):
+        """Append a closed kline from the websocket payload ('k'). Returns False when it would leave a gap."""
+        open_time = int(kline['t'])
+        if not self.expects(open_time):
+            return open_time <= self.last_open_time  # Already stored is fine, a gap is not
+        self.append([(open_time, float(kline['o']), float(kline['h']), float(kline['l']), float(kline['c']),
+                      float(kline['v']), int(kline['T']))])
+        return True
+
+    async def backfill(self, client, history=KLINES_PER_REQUEST):
+        """Download the closed candles missing since the last stored one, or the last `history` candles if empty."""
+        now = int(time.time() * 1000)
+        start = self.last_open_time + self.interval_ms if len(self) else now - history * self.interval_ms
+        while start + self.interval_ms <= now:
+            klines = await client.futures_klines(symbol=self.symbol, interval=self.interval, startTime=start,
+                                                 limit=KLINES_PER_REQUEST)
+            closed = [(int(k[0]), float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]), int(k[6]))
+                      for k in klines if int(k[6]) < now]
+            self.append(closed)
+            if len(klines) < KLINES_PER_REQUEST or not closed:
+                break
+            start = closed[-1][0] + self.interval_ms
@@ -0,0 +1,156 @@
+import asyncio
+import time
+from collections import deque
+import ujson
+import websockets
+from async_trading_bot.metrics import metrics
+from async_trading_bot.price_cache import PRICE_EVENTS
+
+MARKET_STREAM_URL = "wss://fstream.binance.com/stream?streams="
+MAX_STREAMS_PER_CONNECTION = 200  # Binance futures limit for one combined stream connection
+
+
+class SymbolChannel:
+    """
+    Hand-over between the websocket receiver and the consumer of one symbol.
+
+    Each stream keeps only its newest event, an event replaced before the consumer got to it is counted as
+    dropped. Closed klines are never dropped, the indicators and the kline store need every one of them.
+    """
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.latest = {}  # stream key -> (receive time, event)
+        self.closed = deque()  # (receive time, closed kline event)
+        self.ready = asyncio.Event()
+        self.released = asyncio.Event()  # Set once the bot may process events, until then they are kept
+
+    @staticmethod
+    def _key(data):
+        return (data['e'], data['k']['i']) if data['e'] == 'kline' else data['e']
+
+    def put(self, received, data):
+        key = self._key(data)
+        if data['e'] == 'kline' and data['k']['x']:
+            pending = self.latest.get(key)
+            if pending and pending[1]['k']['t'] <= data['k']['t']:
+                del self.latest[key]  # Superseded by the close of the same candle
+                metrics.increment('ws_dropped_events', symbol=self.symbol)
+            self.closed.append((received, data))
+        else:
+            if key in self.latest:
+                metrics.increment('ws_dropped_events', symbol=self.symbol)
+            self.latest[key] = (received, data)
+        self.ready.set()
+
+    def depth(self):
+        return len(self.closed) + len(self.latest)
+
+    def take(self):
+        events = list(self.closed) + list(self.latest.values())
+        self.closed.clear()
+        self.latest.clear()
+        self.ready.clear()
+        return events
+
+
+class MarketStream:
+    """
+    Combined-stream websocket shared by many TradingBot instances.
+
+    Subscribes to the streams of every bot (TradingBot.market_streams) over as few connections as possible. The
+    receive loop only decodes and files each event into the channel of its symbol; a consumer task per bot
+    processes the newest events, so slow processing never stalls the socket or its ping/pong.
+
+    With hold=True the socket connects right away but a bot gets no events before release(symbol), so the stream
+    can be connected while the indicators are still being warmed up.
+    """
+
+    def __init__(self, bots, base_url=None, hold=False):
+        self.url = f"{base_url.rstrip('/')}/stream?streams=" if base_url else MARKET_STREAM_URL
+        self.bots = {bot.symbol: bot for bot in bots}
+        self.channels = {symbol: SymbolChannel(symbol) for symbol in self.bots}
+        self.connected = asyncio.Event()  # Set once every connection was established
+        self._connected_urls = set()
+        if not hold:
+            for channel in self.channels.values():
+                channel.released.set()
+
+    def release(self, symbol):
+        self.channels[symbol].released.set()
+
+    def connections(self):
+        """Split the bots into groups whose streams fit into one connection, return [(url, bots)]."""
+        groups = []
+        names, bots = [], []
+        for bot in self.bots.values():
+            bot_names = bot.market_streams()
+            if names and len(names) + len(bot_names) > MAX_STREAMS_PER_CONNECTION:
+                groups.append((self.url + '/'.join(names), bots))
+                names, bots = [], []
+            names.extend(bot_names)
+            bots.append(bot)
+        if names:
+            groups.append((self.url + '/'.join(names), bots))
+        return groups
+
+    async def start(self):
+        connections = self.connections()
+        self._connection_count = len(connections)
+        await asyncio.gather(*(self._run_connection(url, bots) for url, bots in connections),
+                             *(self._consume(self.bots[symbol], channel) for symbol, channel in self.channels.items()))
+
+    async def _run_connection(self, url, bots):
+        reconnect = False
+        while True:  # Keep attempting to reconnect if the connection is lost
+            try:
+                if reconnect:
+                    # Catch up on candles missed while disconnected
+                    await asyncio.gather(*(bot.warm_up_indicators() for bot in bots))
+                reconnect = True
+                async with websockets.connect(url) as ws:
+                    self._connected_urls.add(url)
+                    if len(self._connected_urls) == self._connection_count:
+                        self.connected.set()
+                    await self.receive_messages(ws)
+            except websockets.exceptions.ConnectionClosed as e:
+                print(f"WebSocket connection closed: {e}")
+                await asyncio.sleep(1)  # Wait before attempting to reconnect
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                await asyncio.sleep(7)  # Wait before attempting to reconnect
+
+    async def receive_messages(self, ws):
+        async for message in ws:
+            received = time.time()
+            try:
+                data = ujson.loads(message).get('data', {})  # Combined stream payload
+            except ValueError as e:
+                print(f"Error decoding message: {e}")
+                continue
+            if data.get('e') == 'error':
+                print(f"Websocket error {data.get('m')}")
+                continue
+            bot = self.bots.get(data.get('s'))
+            if bot is not None:
+                if 'E' in data:
+                    # Exchange event time to local receive, includes clock offset to the exchange
+                    metrics.observe('ws_receive_lag_seconds', max(0.0, received - data['E'] / 1000), stream=data['e'])
+                # Prices are cached right here, so they stay fresh while the consumer is busy
+                bot.price_cache.update(data)
+                if data['e'] not in PRICE_EVENTS:
+                    self.channels[bot.symbol].put(received, data)
+
+    async def _consume(self, bot, channel):
+        await channel.released.wait()
+        while True:
+            await channel.ready.wait()
+            metrics.set_gauge('ws_channel_depth', channel.depth(), symbol=channel.symbol)
+            for received, data in channel.take():
+                started = time.time()
+                metrics.observe('ws_queue_seconds', started - received, stream=data['e'])
+                try:
+                    await bot.handle_market_event(data)
+                except Exception as e:
+                    print(f"Error processing {data['e']} event for {bot.symbol}: {e}")
+                metrics.observe('ws_process_seconds', time.time() - started, stream=data['e'])
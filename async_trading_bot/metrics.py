@@ -0,0 +1,154 @@
+import asyncio
+import bisect
+import functools
+import time
+
+# Upper bounds in seconds, from 100 µs for in-memory work up to 30 s for retried REST calls
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram, observe() is one bisect and two additions."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile."""
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.max
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.counters = {}  # (name, labels) -> value
+        self.gauges = {}  # (name, labels) -> value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def prometheus_text(self):
+        lines = []
+        typed = set()
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name}_total counter")
+                typed.add(name)
+            lines.append(f"{name}_total{_labels(labels)} {value}")
+        for (name, labels), value in sorted(self.gauges.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} gauge")
+                typed.add(name)
+            lines.append(f"{name}{_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        lines = []
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if histogram.count:
+                lines.append(f"{name}{_labels(labels)} n={histogram.count} "
+                             f"avg={histogram.sum / histogram.count * 1000:.2f}ms "
+                             f"p50<={histogram.quantile(0.5) * 1000:.2f}ms p99<={histogram.quantile(0.99) * 1000:.2f}ms "
+                             f"max={histogram.max * 1000:.2f}ms")
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{name}{_labels(labels)} {value}")
+        return '\n'.join(lines)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+metrics = MetricsRegistry()
+
+
+def timed(name='bot_method_seconds'):
+    """Record the duration of every call of the decorated coroutine, labelled with its name."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                metrics.observe(name, time.perf_counter() - started, method=func.__name__)
+
+        return wrapper
+
+    return decorator
+
+
+async def monitor_event_loop(interval=0.5):
+    """Measure how late the event loop wakes a sleeping task, a direct view of blocking work in the loop."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        metrics.observe('event_loop_lag_seconds', max(0.0, time.perf_counter() - started - interval))
+
+
+async def log_summary(interval=300):
+    while True:
+        await asyncio.sleep(interval)
+        print(f"Metrics summary:\n{metrics.summary()}")
+
+
+async def serve_metrics(host='127.0.0.1', port=9100):
+    """Serve the registry in Prometheus text format on http://host:port/metrics."""
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            body = metrics.prometheus_text().encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,68 @@
+import asyncio
+
+
+class TelegramNotifier:
+    """
+    Background Telegram sender.
+
+    notify() never waits: messages go into a bounded queue served by one task over one persistent connection.
+    A message repeated while an identical one is still queued is collapsed into a single "(xN)" message, sends are
+    spaced by `min_interval` and a 429 response is retried after the requested delay.
+    """
+
+    def __init__(self, token, chat_id, max_queue=100, min_interval=1.0):
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage"
+        self.enabled = bool(token and chat_id)
+        self.chat_id = chat_id
+        self.max_queue = max_queue
+        self.min_interval = min_interval
+        self.pending = {}  # message -> number of times it was notified since it was queued
+        self.dropped = 0
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def notify(self, message):
+        if not self.enabled:
+            return
+        if message in self.pending:
+            self.pending[message] += 1
+            return
+        if len(self.pending) >= self.max_queue:
+            self.dropped += 1
+            return
+        self.pending[message] = 1
+        self._queue.put_nowait(message)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        import httpx  # Loaded with the first message, not at startup
+        async with httpx.AsyncClient(timeout=10) as client:
+            while True:
+                message = await self._queue.get()
+                count = self.pending.pop(message, 1)
+                text = message if count == 1 else f"{message} (x{count})"
+                if self.dropped:
+                    text += f"\n{self.dropped} notifications dropped, queue full"
+                    self.dropped = 0
+                await self._send(client, text)
+                await asyncio.sleep(self.min_interval)
+
+    async def _send(self, client, text):
+        import httpx
+        while True:
+            try:
+                response = await client.post(self.url, params={'chat_id': self.chat_id, 'text': text})
+                if response.status_code == 429:
+                    retry_after = response.json().get('parameters', {}).get('retry_after', 5)
+                    print(f"Telegram rate limit, retrying in {retry_after}s")
+                    await asyncio.sleep(retry_after)
+                    continue
+                response.raise_for_status()  # Raises an exception for 4XX/5XX responses
+            except httpx.RequestError as e:
+                print(f"Request failed: {e}")
+            except httpx.HTTPStatusError as e:
+                print(f"Error response {e.response.status_code} while sending message: {e}")
+            except Exception as e:
+                print(f"An unexpected error occurred while sending a message: {e}")
+            return
@@ -0,0 +1,277 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+from async_trading_bot.backtest import (KLINE_COLUMNS, DEFAULT_FEE, DEFAULT_SLIPPAGE, backtest, candle_index,
+                                        crossover_entries_from_ema, load_csv_klines, load_store_klines)
+
+PARAMETERS = ('short_ema_period', 'long_ema_period', 'ema_interval', 'risk_percentage', 'price_increase_trigger')
+CHUNK_SIZE = 64  # Combinations per worker task
+
+_shared = {}  # Worker side: name -> numpy view on shared memory, set by _attach
+_segments = []  # Worker side: SharedMemory handles, kept open for the life of the worker
+
+
+def ema_matrix(values, periods):
+    """
+    EMA of `values` for many periods in one pass, one column per period.
+
+    The time loop runs once and every step updates all periods as one vector operation. Seed and recurrence are
+    the ones of talib.EMA and StreamingEMA, so the columns equal StreamingEMA and talib.EMA to the last bit or two.
+    """
+    periods = np.asarray(periods, dtype=np.int64)
+    k = 2.0 / (periods + 1)
+    sums = np.cumsum(values)
+    seeds = np.where(periods <= len(values), sums[np.minimum(periods, len(values)) - 1] / periods, np.nan)
+    out = np.full((len(values), len(periods)), np.nan)
+    previous = np.full(len(periods), np.nan)
+    for t, value in enumerate(values):
+        previous = ((value - previous) * k) + previous
+        seeded = periods - 1 == t
+        previous[seeded] = seeds[seeded]
+        out[t] = previous
+    return out
+
+
+def walk_forward_windows(n, folds):
+    """[(train_start, train_end, test_start, test_end)] over bar indices, or one full window without folds."""
+    if not folds:
+        return [(0, n, None, None)]
+    size = n // (folds + 1)
+    return [(i * size, (i + 1) * size, (i + 1) * size, min(n, (i + 2) * size)) for i in range(folds)]
+
+
+class SharedArrays:
+    """Parent side: copies numpy arrays into named shared memory blocks that worker processes map without pickling."""
+
+    def __init__(self):
+        self.segments = []
+        self.specs = {}  # name -> (shared memory name, shape, dtype)
+
+    def add(self, name, array):
+        segment = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+        self.segments.append(segment)
+        self.specs[name] = (segment.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+
+
+def _attach(specs):
+    for name, (segment_name, shape, dtype) in specs.items():
+        # Pool workers share the parent's resource tracker, the parent unlinks the blocks in SharedArrays.close
+        segment = shared_memory.SharedMemory(name=segment_name)
+        _segments.append(segment)
+        _shared[name] = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+
+
+def _klines(symbol, start=0, end=None):
+    return {column: _shared[f"{symbol}/{column}"][start:end] for column in KLINE_COLUMNS}
+
+
+def _evaluate(task):
+    """Backtest one (symbol, parameters) combination on every walk-forward window."""
+    symbol, params, base_config, windows, fee, slippage, period_columns, run = task
+    config = {**base_config, **params}
+    interval = config['ema_interval']
+    matrix = _shared[f"{symbol}/ema/{interval}"]
+    klines = _klines(symbol)
+    bars, sides = crossover_entries_from_ema(
+        klines, matrix[:, period_columns[config['short_ema_period']]], config['short_ema_period'],
+        matrix[:, period_columns[config['long_ema_period']]], config['long_ema_period'], interval,
+        config.get('intra_candle', False))
+    folds = []
+    for train_start, train_end, test_start, test_end in windows:
+        fold = {}
+        for label, start, end in (('train', train_start, train_end), ('test', test_start, test_end)):
+            if start is None:
+                continue
+            # EMAs come from the full history, so every window starts with warmed up indicators
+            inside = (bars >= start) & (bars < end)
+            result = backtest(_klines(symbol, start, end), config, fee=fee, slippage=slippage,
+                              entries=(bars[inside] - start, sides[inside]))
+            fold.update((f"{label}_{key}", value) for key, value in result.summary().items())
+        folds.append(fold)
+    row = {'symbol': symbol, **params, 'run': run}
+    row.update((key, float(np.mean([fold[key] for fold in folds]))) for key in folds[0])
+    if windows[0][2] is not None:
+        row['folds'] = folds  # Per window results, walk_forward selects on them
+    return row
+
+
+def _chunk(tasks):
+    return [_evaluate(task) for task in tasks]
+
+
+def run_key(base_config, windows, fee, slippage):
+    """
+    Hash of what a result row depends on besides its symbol and parameters, so a checkpoint written with other
+    folds, klines, costs or base config is not resumed from.
+    """
+    config = {key: value for key, value in base_config.items() if key not in PARAMETERS}
+    data = json.dumps([config, windows, fee, slippage], sort_keys=True, default=str)
+    return hashlib.sha1(data.encode()).hexdigest()[:16]
+
+
+def combination_key(symbol, params, run):
+    return json.dumps([symbol, [params[name] for name in PARAMETERS], run])
+
+
+def optimize(klines_by_symbol, grid, base_config, folds=0, workers=None, checkpoint=None, fee=DEFAULT_FEE,
+             slippage=DEFAULT_SLIPPAGE, rank_by='train_return'):
+    """
+    Backtest every combination of `grid` (parameter -> list of values) on every symbol and return the result rows
+    ranked by `rank_by`. With walk-forward folds the row values are averages over the windows, and the per window
+    results are kept in 'folds' for walk_forward().
+
+    Klines and per-interval EMA matrices live in shared memory, combinations are spread over a process pool in
+    chunks. Finished rows are appended to the `checkpoint` JSONL file, rows already in it from a run with the same
+    settings (see run_key) are not computed again.
+    """
+    grid = {name: list(grid.get(name, [base_config[name]])) for name in PARAMETERS}
+    combinations = [dict(zip(PARAMETERS, values)) for values in itertools.product(*(grid[name] for name in PARAMETERS))]
+    combinations = [params for params in combinations if params['short_ema_period'] < params['long_ema_period']]
+    windows = {symbol: walk_forward_windows(len(klines['close']), folds) for symbol, klines in klines_by_symbol.items()}
+    runs = {symbol: run_key(base_config, windows[symbol], fee, slippage) for symbol in klines_by_symbol}
+
+    rows, done, skipped = [], set(), 0
+    if checkpoint and os.path.exists(checkpoint):
+        with open(checkpoint) as file:
+            for line in file:
+                row = json.loads(line)
+                if row.get('run') != runs.get(row['symbol']):
+                    skipped += 1
+                    continue
+                rows.append(row)
+                done.add(combination_key(row['symbol'], row, row['run']))
+    if skipped:
+        print(f"{skipped} checkpoint rows from a run with other settings are not used")
+
+    shared = SharedArrays()
+    try:
+        periods = sorted(set(grid['short_ema_period']) | set(grid['long_ema_period']))
+        period_columns = {period: column for column, period in enumerate(periods)}
+        tasks = []
+        for symbol, klines in klines_by_symbol.items():
+            for column in KLINE_COLUMNS:
+                shared.add(f"{symbol}/{column}", np.ascontiguousarray(klines[column]))
+            for interval in grid['ema_interval']:
+                last_bar, _ = candle_index(klines['open_time'], interval)
+                shared.add(f"{symbol}/ema/{interval}", ema_matrix(np.asarray(klines['close'][last_bar]), periods))
+            run = runs[symbol]
+            tasks.extend((symbol, params, base_config, windows[symbol], fee, slippage, period_columns, run)
+                         for params in combinations if combination_key(symbol, params, run) not in done)
+
+        chunks = [tasks[i:i + CHUNK_SIZE] for i in range(0, len(tasks), CHUNK_SIZE)]
+        print(f"{len(tasks)} combinations to run, {len(done)} from checkpoint")
+        started = time.perf_counter()
+        finished = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(shared.specs,)) as pool:
+            futures = [pool.submit(_chunk, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                chunk_rows = future.result()
+                rows.extend(chunk_rows)
+                if checkpoint:
+                    with open(checkpoint, 'a') as file:
+                        file.writelines(json.dumps(row) + '\n' for row in chunk_rows)
+                finished += len(chunk_rows)
+                elapsed = time.perf_counter() - started
+                print(f"{finished}/{len(tasks)} combinations, {finished / elapsed:.1f}/s")
+    finally:
+        shared.close()
+    return sorted(rows, key=lambda row: row.get(rank_by, float('-inf')), reverse=True)
+
+
+def walk_forward(rows, metric='return'):
+    """
+    Walk-forward result per symbol from optimize() rows with folds: on every train window the combination with
+    the best train `metric` is picked and its result on the following test window is taken. Symbols are ranked
+    by the average test `metric` of their picks, the out-of-sample estimate of choosing parameters this way.
+    """
+    by_symbol = {}
+    for row in rows:
+        by_symbol.setdefault(row['symbol'], []).append(row)
+    results = []
+    for symbol, symbol_rows in by_symbol.items():
+        picks = []
+        for fold in range(len(symbol_rows[0]['folds'])):
+            best = max(symbol_rows, key=lambda row: row['folds'][fold][f"train_{metric}"])
+            picks.append({'fold': fold, **{name: best[name] for name in PARAMETERS}, **best['folds'][fold]})
+        results.append({'symbol': symbol, f"test_{metric}": float(np.mean([pick[f"test_{metric}"] for pick in picks])),
+                        'picks': picks})
+    return sorted(results, key=lambda result: result[f"test_{metric}"], reverse=True)
+
+
+def to_config(row, base_config):
+    """
+    Config in config.json format trading the symbol of a result row with its parameters. A "symbols" list of the
+    base config is dropped, its other symbols were not optimized with these parameters.
+    """
+    config = {key: value for key, value in base_config.items() if key != 'symbols'}
+    return {**config, 'symbol': row['symbol'], **{name: row[name] for name in PARAMETERS}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parameter sweep of the EMA crossover bot over 1m klines")
+    parser.add_argument('--config', default='config.json', help="base config, also the default for every parameter")
+    parser.add_argument('--grid', required=True, help="JSON file mapping parameters to lists of values")
+    parser.add_argument('--csv', nargs='*', default=[], metavar='SYMBOL=PATH', help="Binance 1m kline CSV files")
+    parser.add_argument('--store', help="kline store directory")
+    parser.add_argument('--symbols', nargs='*', default=[], help="symbols to load from the kline store")
+    parser.add_argument('--folds', type=int, default=0, help="walk-forward folds, 0 backtests the full history")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--checkpoint', help="JSONL file to resume from and append results to")
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--write-config', help="write the best combination to this path in config.json format")
+    args = parser.parse_args()
+    with open(args.config) as file:
+        base_config = json.load(file)
+    with open(args.grid) as file:
+        grid = json.load(file)
+    klines_by_symbol = {}
+    for item in args.csv:
+        symbol, path = item.split('=', 1)
+        klines_by_symbol[symbol] = load_csv_klines(path)
+    if args.symbols:
+        from async_trading_bot.kline_store import KlineStore
+        for symbol in args.symbols:
+            store = KlineStore(args.store or base_config.get('kline_store_dir', 'klines'), symbol, '1m')
+            klines_by_symbol[symbol] = load_store_klines(store)
+
+    rows = optimize(klines_by_symbol, grid, base_config, args.folds, args.workers, args.checkpoint)
+    hidden = {'symbol', 'run', 'folds', *PARAMETERS}
+    columns = ['symbol', *PARAMETERS] + [key for key in rows[0] if key not in hidden] if rows else []
+    print('\t'.join(columns))
+    for row in rows[:args.top]:
+        print('\t'.join(_format(row[column]) for column in columns))
+    best = rows[0] if rows else None
+    if args.folds and rows:
+        results = walk_forward(rows)
+        print("Walk-forward picks, best train return of each window and its test result:")
+        columns = ['symbol', 'fold', *PARAMETERS, 'train_return', 'test_return', 'test_max_drawdown', 'test_trades']
+        print('\t'.join(columns))
+        for result in results:
+            for pick in result['picks']:
+                print('\t'.join(_format({'symbol': result['symbol'], **pick}[column]) for column in columns))
+            print(f"{result['symbol']} walk-forward test return: {result['test_return']:.4f}")
+        # The pick of the newest train window of the best symbol, the one walk-forward would trade next
+        best = {'symbol': results[0]['symbol'], **results[0]['picks'][-1]}
+    if args.write_config and best:
+        with open(args.write_config, 'w') as file:
+            json.dump(to_config(best, base_config), file)
+
+
+def _format(value):
+    return f"{value:.4f}" if isinstance(value, float) else str(value)
+
+
+if __name__ == '__main__':
+    main()
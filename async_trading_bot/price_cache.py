@@ -0,0 +1,47 @@
+import time
+
+PRICE_EVENTS = ('bookTicker', 'markPriceUpdate')  # Events only the price cache is interested in
+
+
+class PriceCache:
+    """
+    Latest prices of one symbol from the market stream: best bid/ask (bookTicker), mark price (markPrice) and last
+    trade price (kline close), each with its local receive time.
+
+    fresh_price() returns the last price, else the bid/ask mid, else the mark price, skipping values older than
+    `max_age` seconds. It returns None when all of them are stale.
+    """
+
+    def __init__(self, symbol, max_age=5.0):
+        self.symbol = symbol
+        self.max_age = max_age
+        self.bid = self.ask = self.last = self.mark = None
+        self.bid_ask_time = self.last_time = self.mark_time = 0.0  # time.monotonic() of the last update
+
+    def update(self, data):
+        now = time.monotonic()
+        event = data.get('e')
+        if event == 'bookTicker':
+            self.bid, self.ask = float(data['b']), float(data['a'])
+            self.bid_ask_time = now
+        elif event == 'markPriceUpdate':
+            self.mark = float(data['p'])
+            self.mark_time = now
+        elif event == 'kline':
+            self.last = float(data['k']['c'])
+            self.last_time = now
+
+    def fresh_price(self):
+        """Freshest stream price not older than max_age, preferring last, then mid of bid/ask, then mark."""
+        oldest = time.monotonic() - self.max_age
+        if self.last is not None and self.last_time >= oldest:
+            return self.last
+        if self.bid is not None and self.bid_ask_time >= oldest:
+            return (self.bid + self.ask) / 2
+        if self.mark is not None and self.mark_time >= oldest:
+            return self.mark
+        return None
+
+    def set_last(self, price):
+        self.last = price
+        self.last_time = time.monotonic()
@@ -0,0 +1,195 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import json
+import random
+import time
+import aiohttp
+from binance.exceptions import BinanceAPIException
+from async_trading_bot.metrics import metrics
+
+PRIORITY_ORDER = 0  # order placement and cancellation
+PRIORITY_INFO = 1  # ticker, account, klines, exchange info, ...
+
+ORDER_METHODS = {'futures_create_order', 'futures_cancel_order', 'futures_cancel_orders',
+                 'futures_place_batch_order', 'futures_cancel_all_open_orders'}
+# Only new orders count against the 10s / 1m order limits, cancels do not
+NEW_ORDER_METHODS = {'futures_create_order', 'futures_place_batch_order'}
+
+# Request weight of the futures endpoints used by the bot, (weight with symbol, weight without symbol)
+REQUEST_WEIGHTS = {
+    'futures_ticker': (1, 40),
+    'futures_symbol_ticker': (1, 2),
+    'futures_get_open_orders': (1, 40),
+    'futures_account': (5, 5),
+    'futures_position_information': (5, 5),
+    'futures_place_batch_order': (5, 5),
+}
+
+# Rejections that happen before the request is executed, safe to retry even for orders
+RETRYABLE_CODES = {-1003, -1021}
+
+
+def request_weight(method, params):
+    if method == 'futures_klines':
+        limit = int(params.get('limit', 500))
+        return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+    with_symbol, without_symbol = REQUEST_WEIGHTS.get(method, (1, 1))
+    return with_symbol if 'symbol' in params else without_symbol
+
+
+def order_count(method, params):
+    """New orders a request counts against the 10s / 1m order limits, one per order of a batch, none for cancels."""
+    if method not in NEW_ORDER_METHODS:
+        return 0
+    orders = params.get('batchOrders')
+    if orders is None:
+        return 1
+    if isinstance(orders, str):
+        orders = json.loads(orders)  # Passed as a JSON list, like python-binance sends it
+    return max(1, len(orders))
+
+
+class TokenBucket:
+    """
+    Token bucket for one Binance limit. `reserve` is a share of the capacity that only order requests may use, so
+    informational calls can never starve order placement.
+    """
+
+    def __init__(self, capacity, window, reserve=0.0):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.reserve = capacity * reserve
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost, priority):
+        """Seconds until `cost` tokens are available for a request of the given priority."""
+        self._refill()
+        floor = 0.0 if priority == PRIORITY_ORDER else self.reserve
+        deficit = cost + floor - self.tokens
+        return max(0.0, deficit / self.rate)
+
+    def take(self, cost):
+        self.tokens -= cost
+
+    def sync(self, used):
+        """Align with the usage reported by the exchange, which also counts other processes on the same IP/account."""
+        self._refill()
+        self.tokens = min(self.tokens, self.capacity - used)
+
+
+class RequestScheduler:
+    """
+    Wraps an AsyncClient: every futures_* call goes through weight and order-count token buckets, order requests
+    are served before informational ones, and failures are retried with jittered exponential backoff that honours
+    Retry-After. Bucket levels follow the X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-* response headers.
+    """
+
+    def __init__(self, client, weight_limit=2400, order_limit_10s=300, order_limit_1m=1200, attempts=5,
+                 base_delay=0.5, max_delay=30.0):
+        self.client = client
+        self.weight = TokenBucket(weight_limit, 60, reserve=0.2)
+        self.orders_10s = TokenBucket(order_limit_10s, 10)
+        self.orders_1m = TokenBucket(order_limit_1m, 60)
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.blocked_until = 0.0  # monotonic time until which the exchange asked us to stop (429/418)
+        self._waiters = []  # heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self._head_changed = asyncio.Event()
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name.startswith('futures_') and asyncio.iscoroutinefunction(attr):
+            return functools.partial(self.request, name)
+        return attr
+
+    async def request(self, method, *args, **kwargs):
+        is_order = method in ORDER_METHODS
+        priority = PRIORITY_ORDER if is_order else PRIORITY_INFO
+        weight = request_weight(method, kwargs)
+        orders = order_count(method, kwargs)
+        for attempt in range(self.attempts):
+            started = time.perf_counter()
+            await self._acquire(weight, orders, priority)
+            sent = time.perf_counter()
+            metrics.observe('rest_throttle_seconds', sent - started, method=method)
+            try:
+                result = await getattr(self.client, method)(*args, **kwargs)
+                metrics.observe('rest_request_seconds', time.perf_counter() - sent, method=method)
+                self._update_from_headers(getattr(self.client, 'response', None))
+                return result
+            except BinanceAPIException as e:
+                self._update_from_headers(e.response)
+                if e.status_code in (418, 429) or e.code == -1003:
+                    delay = self._retry_after(e.response) or self._backoff(attempt)
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+                elif e.code in RETRYABLE_CODES or (e.status_code >= 500 and not is_order):
+                    delay = self._backoff(attempt)
+                else:
+                    raise
+                error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if is_order:
+                    raise  # The order may have reached the exchange, resending it could double the position
+                delay = self._backoff(attempt)
+                error = e
+            if attempt == self.attempts - 1:
+                raise error
+            print(f"Attempt {attempt + 1} failed for {method}: {error}. Retrying in {delay:.2f}s")
+            metrics.increment('rest_retries', method=method)
+            metrics.observe('rest_retry_sleep_seconds', delay, method=method)
+            await asyncio.sleep(delay)
+
+    async def _acquire(self, weight, orders, priority):
+        ticket = (priority, next(self._sequence))
+        heapq.heappush(self._waiters, ticket)
+        try:
+            while True:
+                if self._waiters[0] != ticket:
+                    # Someone with a higher priority or an earlier ticket goes first
+                    await self._head_changed.wait()
+                    continue
+                delay = max(self.blocked_until - time.monotonic(), self.weight.wait_time(weight, priority))
+                if orders:
+                    delay = max(delay, self.orders_10s.wait_time(orders, priority),
+                                self.orders_1m.wait_time(orders, priority))
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self.weight.take(weight)
+            if orders:
+                self.orders_10s.take(orders)
+                self.orders_1m.take(orders)
+        finally:
+            self._waiters.remove(ticket)
+            heapq.heapify(self._waiters)
+            self._head_changed.set()
+            self._head_changed = asyncio.Event()
+
+    def _update_from_headers(self, response):
+        headers = getattr(response, 'headers', None)
+        if not headers:
+            return
+        for header, bucket in (('X-MBX-USED-WEIGHT-1M', self.weight), ('X-MBX-ORDER-COUNT-10S', self.orders_10s),
+                               ('X-MBX-ORDER-COUNT-1M', self.orders_1m)):
+            if header in headers:
+                bucket.sync(int(headers[header]))
+
+    @staticmethod
+    def _retry_after(response):
+        headers = getattr(response, 'headers', None)
+        if headers and 'Retry-After' in headers:
+            return float(headers['Retry-After'])
+        return None
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
@@ -0,0 +1,134 @@
+import asyncio
+import functools
+import time
+from async_trading_bot.market_stream import MarketStream
+from async_trading_bot.metrics import log_summary, metrics, monitor_event_loop, serve_metrics
+from async_trading_bot.rate_limiter import RequestScheduler
+from async_trading_bot.strategy import EmaCrossoverStrategy
+from async_trading_bot.symbol_info import SymbolMetadataCache
+from async_trading_bot.trade_bot import TradingBot
+from async_trading_bot.user_stream import AccountState, UserDataStream
+from async_trading_bot.utils import create_client, expand_symbol_configs, sync_server_time
+
+
+class StartupTimer:
+    """Start and end of every startup phase, relative to `started` (a time.perf_counter() value)."""
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases = {}  # name -> (start, end) in seconds since started
+
+    def add(self, name, start, end):
+        self.phases[name] = (start - self.started, end - self.started)
+        metrics.set_gauge('startup_phase_seconds', end - start, phase=name)
+
+    async def phase(self, name, awaitable):
+        start = time.perf_counter()
+        result = await awaitable
+        self.add(name, start, time.perf_counter())
+        return result
+
+    def report(self):
+        ready = max(end for _, end in self.phases.values())
+        metrics.set_gauge('startup_ready_seconds', ready)
+        phases = ', '.join(f"{name} {(end - start) * 1000:.0f} ms (done at {end * 1000:.0f})"
+                           for name, (start, end) in sorted(self.phases.items(), key=lambda item: item[1][1]))
+        print(f"Ready in {ready * 1000:.0f} ms: {phases}")
+
+
+class MultiSymbolRunner:
+    """
+    Runs one TradingBot per configured symbol in a single event loop.
+
+    All bots share one AsyncClient (and so one HTTP connection pool), one exchange info cache, one user data
+    stream, one Telegram notifier, one trade journal and ledger and one combined market stream websocket.
+
+    Startup runs its phases concurrently: the market stream connects while the server time, exchange info,
+    account snapshot and kline history are requested and the ledger is rebuilt from the journal. Market events
+    received meanwhile are kept until all of them are done, so no bot trades before its account is synced.
+    """
+
+    def __init__(self, api_key, api_secret, config, startup=None):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.config = config
+        self.startup = startup or StartupTimer()
+        self.bots = []
+        for symbol_config in expand_symbol_configs(config):
+            bot = TradingBot(api_key, api_secret, symbol_config)
+            bot.strategy = EmaCrossoverStrategy(bot, symbol_config.get("intra_candle", False))
+            self.bots.append(bot)
+        self.stream_timeout = config.get("startup_stream_timeout", 30)
+        self.client = None
+        self.symbol_metadata = None
+        self.user_stream = None
+        self.journal = self.bots[0].journal
+        self.ledger = self.bots[0].ledger
+
+    async def init_client(self):
+        """Create the shared client, metadata cache and user data stream, without any request yet."""
+        client = await create_client(self.api_key, self.api_secret, self.config.get("rest_url"), sync_time=False)
+        # All REST calls of all bots go through one scheduler, so they share the rate limit budget
+        self.client = RequestScheduler(client)
+        self.symbol_metadata = SymbolMetadataCache(self.client, self.config.get("exchange_info_ttl", 3600))
+        self.user_stream = UserDataStream(self.client, AccountState(), base_url=self.config.get("ws_url"))
+        notifier = self.bots[0].notifier
+        for bot in self.bots:
+            bot.attach(self.client, self.symbol_metadata, self.user_stream, notifier, self.journal, self.ledger)
+        return client
+
+    async def start_account(self, server_time, ledger_loaded, tasks):
+        """
+        Start the user data stream once the clock is synced and the ledger is rebuilt, and wait for the account
+        snapshot. The ledger books the fills missed while the bot or the stream was down on every snapshot.
+        """
+        await asyncio.gather(server_time, ledger_loaded)
+        account = self.user_stream.account
+        account.order_listeners.append(self.ledger.on_order_update)
+        account.update_listeners.append(self.ledger.on_account_update)
+        symbols = [bot.symbol for bot in self.bots]
+        self.user_stream.sync_listeners.append(functools.partial(self.ledger.sync, self.client, symbols))
+        tasks.append(asyncio.create_task(self.user_stream.start()))
+        await self.wait_for_stream(self.user_stream.ready, "User data stream")
+
+    async def wait_for_stream(self, ready, name):
+        """Wait for a stream to be ready, at most stream_timeout seconds. The bots fall back to REST meanwhile."""
+        try:
+            await asyncio.wait_for(ready.wait(), self.stream_timeout)
+        except asyncio.TimeoutError:
+            print(f"{name} not ready after {self.stream_timeout}s, starting without it")
+
+    async def run(self):
+        startup = self.startup
+        market_stream = MarketStream(self.bots, self.config.get("ws_url"), hold=True)
+        tasks = [asyncio.create_task(market_stream.start())]
+        try:
+            client = await startup.phase('client', self.init_client())
+            print(f"Init client for {', '.join(bot.symbol for bot in self.bots)}")
+            # Public requests do not need the clock offset, only the signed account snapshot waits for it
+            server_time = asyncio.create_task(startup.phase('server_time', sync_server_time(client)))
+            ledger_loaded = asyncio.create_task(startup.phase('ledger', self.ledger.load()))
+            await asyncio.gather(
+                server_time, ledger_loaded,
+                startup.phase('exchange_info', self.symbol_metadata.load()),
+                startup.phase('account', self.start_account(server_time, ledger_loaded, tasks)),
+                startup.phase('history', asyncio.gather(*(bot.warm_up_indicators() for bot in self.bots))),
+                startup.phase('market_stream', self.wait_for_stream(market_stream.connected, "Market stream")))
+            self.symbol_metadata.start_refresh()
+            for bot in self.bots:
+                market_stream.release(bot.symbol)  # The events received since the connect are handled now
+            # A crossover that is already in place is acted on right away
+            await startup.phase('strategy', asyncio.gather(*(bot.strategy.start() for bot in self.bots)))
+            startup.report()
+            services = [monitor_event_loop(), log_summary(self.config.get("metrics_log_interval", 300))]
+            if self.config.get("metrics_port"):
+                services.append(serve_metrics(port=self.config["metrics_port"]))
+            tasks.extend(asyncio.create_task(service) for service in services)
+            # From here on the strategies are driven by kline events, there is no polling loop
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self.journal.close()
+            if self.client is not None:
+                await self.client.close_connection()
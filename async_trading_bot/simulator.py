@@ -0,0 +1,625 @@
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+from urllib.parse import unquote_plus
+import numpy as np
+from aiohttp import web
+from async_trading_bot.backtest import load_csv_klines, load_store_klines
+from async_trading_bot.utils import INTERVAL_MS, MINUTE_MS
+
+TAKER_FEE = 0.0004
+TICKS_PER_CANDLE = 4  # Every recorded 1m candle is replayed as open, high/low, low/high and close ticks
+KLINES_LIMIT = 1500  # futures_klines maximum limit
+# (HTTP status, Binance error code, message) of the errors injected with error_rate
+DEFAULT_ERRORS = (
+    (503, -1001, "Internal error; unable to process your request. Please try again."),
+    (429, -1003, "Too many requests; current limit is 2400 request weight per 1 MINUTE."),
+    (408, -1007, "Timeout waiting for response from backend server. Send status unknown; execution status unknown."),
+)
+
+
+class SimulatedExchange:
+    """
+    Local stand-in for the Binance USDT-M futures REST API and websockets, driven by recorded 1m klines.
+
+    Every candle is replayed as TICKS_PER_CANDLE price ticks, `speed` times faster than real time (0 replays as fast
+    as the clients read). Each tick is sent on the kline (any interval, aggregated from 1m), bookTicker and markPrice
+    streams, and fills resting STOP_MARKET / TRAILING_STOP_MARKET / LIMIT orders of the single simulated account
+    (one-way mode, USDT). MARKET orders fill at the last tick price. Order and account changes are pushed on the user
+    data stream.
+
+    REST responses are delayed by `latency` plus up to `jitter` seconds, and a fraction `error_rate` of them is
+    answered with one of `errors` instead. The replay starts with the first market stream connection, the
+    `history` candles before it are served as kline history.
+    """
+
+    def __init__(self, klines_by_symbol, speed=60.0, history=KLINES_LIMIT, balance=10000.0, fee=TAKER_FEE,
+                 latency=0.0, jitter=0.0, error_rate=0.0, errors=DEFAULT_ERRORS):
+        self.klines = klines_by_symbol
+        for klines in self.klines.values():
+            klines.setdefault('volume', np.zeros(len(klines['close'])))
+        self.speed = speed
+        self.fee = fee
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.errors = errors
+        self.cursor = {symbol: min(history, len(k['close']) - 1) for symbol, k in self.klines.items()}
+        self.partial = {}  # symbol -> (open, high, low, close) of the replayed candle so far
+        self.price = {}
+        for symbol, klines in self.klines.items():
+            previous = klines['close'][max(self.cursor[symbol] - 1, 0)]
+            self.partial[symbol] = (previous, previous, previous, previous)
+            self.price[symbol] = float(previous)
+        self.symbol_rules = {symbol: self._rules(symbol, k['close']) for symbol, k in self.klines.items()}
+        self.balance = balance
+        self.positions = {symbol: {'amount': 0.0, 'entry': 0.0, 'time': 0} for symbol in self.klines}
+        self.leverage = {symbol: 20 for symbol in self.klines}
+        self.open_orders = {symbol: {} for symbol in self.klines}
+        self.trailing_extremes = {}  # orderId -> best price since activation of a TRAILING_STOP_MARKET order
+        self.order_ids = itertools.count(1)
+        self.trade_ids = itertools.count(1)
+        self.trades = {symbol: [] for symbol in self.klines}  # userTrades of every symbol
+        self.market_clients = {}  # websocket -> set of subscribed stream names
+        self.user_clients = set()
+        self.listen_keys = set()
+        self.started = asyncio.Event()
+        self.finished = asyncio.Event()
+        # Statistics for the benchmark
+        self.replay_started = self.replay_finished = None
+        self.ticks = 0
+        self.events_sent = 0
+        self.requests = 0
+        self.injected_errors = 0
+        self.weight_minute, self.weight = 0, 0
+        self.tick_time = {}  # symbol -> time.time() the last tick was handed to the market stream clients
+        self.close_time = {}  # symbol -> time.time() the last tick closing a 1m candle was handed to the clients
+        self.tick_to_trade = []  # seconds from the last tick to the arrival of every entry order
+        self.close_to_trade = []  # seconds from the last candle close to the arrival of every entry order
+
+    @staticmethod
+    def _rules(symbol, closes):
+        sample = closes[-1000:]
+        decimals = max(len(f"{price:.8f}".rstrip('0').split('.')[1]) for price in sample)
+        tick_size = 10 ** -decimals
+        step_size = 10 ** max(-3, math.floor(math.log10(1 / float(np.median(sample)))))
+        return {'symbol': symbol, 'status': 'TRADING', 'contractType': 'PERPETUAL', 'quoteAsset': 'USDT',
+                'pricePrecision': decimals, 'quantityPrecision': max(0, -round(math.log10(step_size))),
+                'filters': [
+                    {'filterType': 'PRICE_FILTER', 'tickSize': f"{tick_size:.8f}", 'minPrice': f"{tick_size:.8f}",
+                     'maxPrice': '1000000'},
+                    {'filterType': 'LOT_SIZE', 'stepSize': f"{step_size:.3f}", 'minQty': f"{step_size:.3f}",
+                     'maxQty': '100000000'},
+                    {'filterType': 'MARKET_LOT_SIZE', 'stepSize': f"{step_size:.3f}", 'minQty': f"{step_size:.3f}",
+                     'maxQty': '100000000'},
+                    {'filterType': 'MIN_NOTIONAL', 'notional': '5'}]}
+
+    # Replay
+
+    async def replay(self, symbol):
+        klines = self.klines[symbol]
+        step = 60 / self.speed / TICKS_PER_CANDLE if self.speed else 0
+        for i in range(self.cursor[symbol], len(klines['close'])):
+            self.cursor[symbol] = i
+            open_, high, low, close = (float(klines[name][i]) for name in ('open', 'high', 'low', 'close'))
+            # A falling candle is assumed to reach its high first, a rising one its low
+            path = (open_, high, low, close) if close < open_ else (open_, low, high, close)
+            candle_high = candle_low = open_
+            for tick, price in enumerate(path):
+                candle_high, candle_low = max(candle_high, price), min(candle_low, price)
+                self.partial[symbol] = (open_, candle_high, candle_low, price)
+                await self.on_tick(symbol, price, tick == TICKS_PER_CANDLE - 1)
+                await asyncio.sleep(step)
+
+    async def run_replay(self):
+        await self.started.wait()
+        self.replay_started = time.time()
+        await asyncio.gather(*(self.replay(symbol) for symbol in self.klines))
+        self.replay_finished = time.time()
+        self.finished.set()
+        print(f"Replay finished: {json.dumps(self.stats())}")
+
+    async def on_tick(self, symbol, price, closed):
+        self.ticks += 1
+        self.price[symbol] = price
+        for order in list(self.open_orders[symbol].values()):
+            if self._triggered(order, price):
+                await self._fill(order, float(order['price']) if order['type'] == 'LIMIT' else price)
+        await self._publish_market(symbol, price, closed)
+
+    def _triggered(self, order, price):
+        buy = order['side'] == 'BUY'
+        if order['type'] == 'TRAILING_STOP_MARKET':
+            # Active once the activation price is reached, then fills callbackRate away from the best price since
+            extreme = self.trailing_extremes.get(order['orderId'])
+            if extreme is None:
+                activate = float(order['activatePrice'])
+                if (price <= activate) if buy else (price >= activate):
+                    self.trailing_extremes[order['orderId']] = price
+                return False
+            extreme = min(extreme, price) if buy else max(extreme, price)
+            self.trailing_extremes[order['orderId']] = extreme
+            rate = float(order['priceRate']) / 100
+            return price >= extreme * (1 + rate) if buy else price <= extreme * (1 - rate)
+        if order['type'] == 'STOP_MARKET':
+            stop = float(order['stopPrice'])
+            return price >= stop if buy else price <= stop
+        if order['type'] == 'LIMIT':
+            limit = float(order['price'])
+            return price <= limit if buy else price >= limit
+        return False
+
+    def candles(self, symbol, interval, start_time=None, end_time=None, limit=500):
+        """Kline rows as served by GET /fapi/v1/klines, aggregated from the 1m candles replayed so far."""
+        klines = self.klines[symbol]
+        interval_ms = INTERVAL_MS[interval]
+        ratio = interval_ms // MINUTE_MS
+        current = self.cursor[symbol]
+        open_time = klines['open_time'][:current + 1]
+        if start_time is not None:
+            low = int(np.searchsorted(open_time, start_time // interval_ms * interval_ms))
+            high = min(current + 1, low + (limit + 1) * ratio)
+        else:
+            high = current + 1 if end_time is None else int(np.searchsorted(open_time, end_time, 'right'))
+            low = max(0, high - (limit + 1) * ratio)
+        if low >= high:
+            return []
+        columns = {name: np.array(klines[name][low:high], dtype=np.float64)
+                   for name in ('open', 'high', 'low', 'close', 'volume')}
+        if high == current + 1:
+            # The replayed candle only shows the ticks sent so far
+            for name, value in zip(('open', 'high', 'low', 'close'), self.partial[symbol]):
+                columns[name][-1] = value
+        bucket = klines['open_time'][low:high] // interval_ms * interval_ms
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+        ends = np.append(starts[1:] - 1, len(bucket) - 1)
+        rows = [[int(t), str(o), str(h), str(l), str(c), str(v), int(t) + interval_ms - 1, '0', 0, '0', '0', '0']
+                for t, o, h, l, c, v in zip(bucket[starts], columns['open'][starts],
+                                            np.maximum.reduceat(columns['high'], starts),
+                                            np.minimum.reduceat(columns['low'], starts), columns['close'][ends],
+                                            np.add.reduceat(columns['volume'], starts))]
+        if start_time is not None:
+            rows = [row for row in rows if row[0] >= start_time][:limit]
+        if end_time is not None:
+            rows = [row for row in rows if row[0] <= end_time]
+        return rows[-limit:]
+
+    async def _publish_market(self, symbol, price, closed):
+        now = time.time()
+        event_time = int(now * 1000)
+        prefix = symbol.lower() + '@'
+        events = {}
+        for ws, streams in list(self.market_clients.items()):
+            for stream in streams:
+                if not stream.startswith(prefix):
+                    continue
+                if stream not in events:
+                    events[stream] = json.dumps({'stream': stream,
+                                                 'data': self._market_event(symbol, stream, price, closed, event_time)})
+                try:
+                    await ws.send_str(events[stream])
+                    self.events_sent += 1
+                except ConnectionError:
+                    self.market_clients.pop(ws, None)
+                    break
+        self.tick_time[symbol] = now
+        if closed:
+            self.close_time[symbol] = now
+
+    def _market_event(self, symbol, stream, price, closed, event_time):
+        name = stream.split('@', 1)[1]
+        if name.startswith('kline_'):
+            interval = name[len('kline_'):]
+            t, o, h, l, c, v, close_time = self.candles(symbol, interval, limit=1)[-1][:7]
+            interval_closed = closed and (self.klines[symbol]['open_time'][self.cursor[symbol]] + MINUTE_MS) \
+                % INTERVAL_MS[interval] == 0
+            return {'e': 'kline', 'E': event_time, 's': symbol,
+                    'k': {'t': t, 'T': close_time, 's': symbol, 'i': interval, 'f': 0, 'L': 0, 'o': o, 'c': c,
+                          'h': h, 'l': l, 'v': v, 'n': 0, 'x': bool(interval_closed), 'q': '0', 'V': '0', 'Q': '0',
+                          'B': '0'}}
+        tick_size = float(self.symbol_rules[symbol]['filters'][0]['tickSize'])
+        if name == 'bookTicker':
+            return {'e': 'bookTicker', 'u': self.ticks, 'E': event_time, 'T': event_time, 's': symbol,
+                    'b': str(price - tick_size), 'B': '1', 'a': str(price + tick_size), 'A': '1'}
+        if name.startswith('markPrice'):
+            return {'e': 'markPriceUpdate', 'E': event_time, 's': symbol, 'p': str(price), 'i': str(price),
+                    'P': str(price), 'r': '0.00010000', 'T': event_time}
+        return {'e': 'error', 'm': f"Unsupported stream {stream}"}
+
+    # Account
+
+    def _new_order(self, params):
+        symbol = params.get('symbol')
+        if symbol not in self.klines:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        order_type = params.get('type')
+        if order_type not in ('MARKET', 'LIMIT', 'STOP_MARKET', 'TRAILING_STOP_MARKET'):
+            return 400, {'code': -1116, 'msg': 'Invalid orderType.'}
+        close_position = params.get('closePosition') == 'true'
+        if 'quantity' not in params and not close_position:
+            return 400, {'code': -1102, 'msg': "Mandatory parameter 'quantity' was not sent."}
+        if order_type == 'STOP_MARKET' and 'stopPrice' not in params:
+            return 400, {'code': -1102, 'msg': "Mandatory parameter 'stopPrice' was not sent."}
+        if order_type == 'TRAILING_STOP_MARKET' and 'callbackRate' not in params:
+            return 400, {'code': -1102, 'msg': "Mandatory parameter 'callbackRate' was not sent."}
+        if order_type == 'LIMIT' and 'price' not in params:
+            return 400, {'code': -1102, 'msg': "Mandatory parameter 'price' was not sent."}
+        order_id = next(self.order_ids)
+        order = {'orderId': order_id, 'symbol': symbol, 'status': 'NEW',
+                 'clientOrderId': params.get('newClientOrderId', f"sim{order_id}"), 'price': params.get('price', '0'),
+                 'avgPrice': '0.00', 'origQty': params.get('quantity', '0'), 'executedQty': '0', 'cumQuote': '0',
+                 'timeInForce': params.get('timeInForce', 'GTC'), 'type': order_type,
+                 'reduceOnly': params.get('reduceOnly') == 'true' or close_position, 'closePosition': close_position,
+                 'side': params.get('side'), 'positionSide': 'BOTH', 'stopPrice': params.get('stopPrice', '0'),
+                 'workingType': 'CONTRACT_PRICE', 'priceProtect': False, 'origType': order_type,
+                 'updateTime': int(time.time() * 1000)}
+        if order_type == 'TRAILING_STOP_MARKET':
+            order.update(activatePrice=params.get('activationPrice', str(self.price[symbol])),
+                         priceRate=params['callbackRate'])
+        if order_type == 'STOP_MARKET' and self._triggered(order, self.price[symbol]):
+            return 400, {'code': -2021, 'msg': 'Order would immediately trigger.'}
+        return 200, order
+
+    async def create_order(self, params, received):
+        status, order = self._new_order(params)
+        if status != 200:
+            return status, order
+        symbol = order['symbol']
+        await self._publish_order(order, 'NEW')
+        if order['type'] == 'MARKET':
+            if not order['reduceOnly'] and symbol in self.tick_time:
+                self.tick_to_trade.append(received - self.tick_time[symbol])
+                self.close_to_trade.append(received - self.close_time.get(symbol, self.tick_time[symbol]))
+            response = dict(order)
+            await self._fill(order, self.price[symbol])
+            if params.get('newOrderRespType') == 'RESULT':
+                response = order
+            return 200, response
+        self.open_orders[symbol][order['orderId']] = order
+        return 200, order
+
+    async def cancel_order(self, symbol, order_id):
+        order = self.open_orders.get(symbol, {}).pop(order_id, None)
+        self.trailing_extremes.pop(order_id, None)
+        if order is None:
+            return 400, {'code': -2011, 'msg': 'Unknown order sent.'}
+        order.update(status='CANCELED', updateTime=int(time.time() * 1000))
+        await self._publish_order(order, 'CANCELED')
+        return 200, order
+
+    async def _fill(self, order, price):
+        symbol = order['symbol']
+        self.open_orders[symbol].pop(order['orderId'], None)
+        self.trailing_extremes.pop(order['orderId'], None)
+        position = self.positions[symbol]
+        signed = 1 if order['side'] == 'BUY' else -1
+        quantity = float(order['origQty'])
+        if order['reduceOnly']:
+            # Reduce-only and close-position orders never open or flip a position
+            reducible = abs(position['amount']) if position['amount'] * signed < 0 else 0.0
+            quantity = reducible if order['closePosition'] else min(quantity, reducible)
+            if quantity == 0:
+                order.update(status='EXPIRED', updateTime=int(time.time() * 1000))
+                await self._publish_order(order, 'EXPIRED')
+                return
+        amount, entry = position['amount'], position['entry']
+        realized = 0.0
+        new_amount = amount + signed * quantity
+        if amount * signed < 0:
+            realized = min(abs(amount), quantity) * (price - entry) * (1 if amount > 0 else -1)
+            if abs(new_amount) < 1e-12:
+                new_amount, entry = 0.0, 0.0
+            elif new_amount * amount < 0:
+                entry = price  # Flipped, the rest is a new position at the fill price
+        else:
+            entry = (abs(amount) * entry + quantity * price) / abs(new_amount)
+        now = int(time.time() * 1000)
+        position.update(amount=new_amount, entry=entry, time=now)
+        fee = quantity * price * self.fee
+        self.balance += realized - fee
+        order.update(status='FILLED', executedQty=f"{quantity:g}", avgPrice=str(price), cumQuote=str(quantity * price),
+                     updateTime=now)
+        trade_id = next(self.trade_ids)
+        self.trades[symbol].append({'symbol': symbol, 'id': trade_id, 'orderId': order['orderId'],
+                                    'side': order['side'], 'price': str(price), 'qty': f"{quantity:g}",
+                                    'realizedPnl': str(realized), 'quoteQty': str(quantity * price),
+                                    'commission': str(fee), 'commissionAsset': 'USDT', 'time': now,
+                                    'positionSide': 'BOTH', 'buyer': order['side'] == 'BUY', 'maker': False})
+        await self._publish_order(order, 'TRADE', quantity, price, fee, realized, trade_id)
+        await self._publish_user(self._account_event(symbol))
+
+    async def _publish_order(self, order, execution, last_quantity=0.0, last_price=0.0, fee=0.0, realized=0.0,
+                             trade_id=0):
+        now = int(time.time() * 1000)
+        await self._publish_user({
+            'e': 'ORDER_TRADE_UPDATE', 'E': now, 'T': now,
+            'o': {'s': order['symbol'], 'c': order['clientOrderId'], 'S': order['side'], 'o': order['type'],
+                  'f': order['timeInForce'], 'q': order['origQty'], 'p': order['price'], 'ap': order['avgPrice'],
+                  'sp': order['stopPrice'], 'x': execution, 'X': order['status'], 'i': order['orderId'],
+                  'l': str(last_quantity), 'z': order['executedQty'], 'L': str(last_price), 'N': 'USDT',
+                  'n': str(fee), 'T': now, 't': trade_id,
+                  'R': order['reduceOnly'], 'wt': 'CONTRACT_PRICE', 'ot': order['origType'], 'ps': 'BOTH',
+                  'cp': order['closePosition'], 'rp': str(realized)}})
+
+    def _account_event(self, symbol):
+        now = int(time.time() * 1000)
+        return {'e': 'ACCOUNT_UPDATE', 'E': now, 'T': now,
+                'a': {'m': 'ORDER', 'B': [{'a': 'USDT', 'wb': str(self.balance), 'cw': str(self.balance), 'bc': '0'}],
+                      'P': [self._position_update(symbol)]}}
+
+    def _position_update(self, symbol):
+        position = self.positions[symbol]
+        return {'s': symbol, 'pa': str(position['amount']), 'ep': str(position['entry']), 'cr': '0',
+                'up': str(self._unrealized(symbol)), 'mt': 'cross', 'iw': '0', 'ps': 'BOTH'}
+
+    def _unrealized(self, symbol):
+        position = self.positions[symbol]
+        return position['amount'] * (self.price[symbol] - position['entry'])
+
+    async def _publish_user(self, event):
+        message = json.dumps(event)
+        for ws in list(self.user_clients):
+            try:
+                await ws.send_str(message)
+            except ConnectionError:
+                self.user_clients.discard(ws)
+
+    def stats(self):
+        """
+        Replay throughput and entry order latencies. tick_to_trade is measured from the last tick sent before the
+        order arrived, close_to_trade from the last candle close. Both are only meaningful when the replay is slow
+        enough for the bot to keep up, e.g. ticks farther apart than the bot's reaction time.
+        """
+        elapsed = (self.replay_finished or time.time()) - self.replay_started if self.replay_started else 0.0
+        stats = {'finished': self.finished.is_set(), 'replay_finished': self.replay_finished,
+                 'elapsed_seconds': elapsed, 'ticks': self.ticks,
+                 'ticks_per_second': self.ticks / elapsed if elapsed else 0.0, 'events_sent': self.events_sent,
+                 'events_per_second': self.events_sent / elapsed if elapsed else 0.0, 'requests': self.requests,
+                 'injected_errors': self.injected_errors, 'entry_orders': len(self.tick_to_trade)}
+        for name, values in (('tick_to_trade', self.tick_to_trade), ('close_to_trade', self.close_to_trade)):
+            latencies = np.array(values) * 1000
+            for p in (50, 90, 99, 100):
+                stats[f"{name}_p{p}_ms"] = float(np.percentile(latencies, p)) if len(latencies) else None
+        return {**stats, 'balance': self.balance,
+                'positions': {symbol: dict(position) for symbol, position in self.positions.items()}}
+
+    # HTTP
+
+    def _endpoint(self, handler, weight=1, inject_errors=True):
+        async def endpoint(request):
+            received = time.time()
+            self.requests += 1
+            minute = int(received // 60)
+            if minute != self.weight_minute:
+                self.weight_minute, self.weight = minute, 0
+            self.weight += weight
+            headers = {'X-MBX-USED-WEIGHT-1M': str(self.weight)}
+            params = dict(request.query)
+            if request.can_read_body:
+                params.update(await request.post())
+            if self.latency or self.jitter:
+                await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+            if inject_errors and self.error_rate and random.random() < self.error_rate:
+                self.injected_errors += 1
+                status, code, msg = random.choice(self.errors)
+                if status == 429:
+                    headers['Retry-After'] = '1'
+                return web.json_response({'code': code, 'msg': msg}, status=status, headers=headers)
+            result = await handler(params, received)
+            status, body = result if isinstance(result, tuple) else (200, result)
+            return web.json_response(body, status=status, headers=headers)
+        return endpoint
+
+    async def _ping(self, params, received):
+        return {}
+
+    async def _time(self, params, received):
+        return {'serverTime': int(time.time() * 1000)}
+
+    async def _exchange_info(self, params, received):
+        return {'timezone': 'UTC', 'serverTime': int(time.time() * 1000), 'rateLimits': [],
+                'symbols': list(self.symbol_rules.values())}
+
+    async def _klines(self, params, received):
+        if params.get('symbol') not in self.klines:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        if params.get('interval') not in INTERVAL_MS:
+            return 400, {'code': -1120, 'msg': 'Invalid interval.'}
+        start_time = int(params['startTime']) if 'startTime' in params else None
+        end_time = int(params['endTime']) if 'endTime' in params else None
+        limit = min(int(params.get('limit', 500)), KLINES_LIMIT)
+        return self.candles(params['symbol'], params['interval'], start_time, end_time, limit)
+
+    async def _ticker_price(self, params, received):
+        prices = [{'symbol': symbol, 'price': str(price), 'time': int(received * 1000)}
+                  for symbol, price in self.price.items()]
+        return next((p for p in prices if p['symbol'] == params['symbol']), {}) if 'symbol' in params else prices
+
+    async def _ticker_24hr(self, params, received):
+        tickers = []
+        for symbol in self.klines:
+            rows = self.candles(symbol, '1m', limit=KLINES_LIMIT)[-1440:]
+            tickers.append({'symbol': symbol, 'lastPrice': str(self.price[symbol]), 'openPrice': rows[0][1],
+                            'highPrice': str(max(float(r[2]) for r in rows)),
+                            'lowPrice': str(min(float(r[3]) for r in rows)),
+                            'volume': str(sum(float(r[5]) for r in rows)), 'openTime': rows[0][0],
+                            'closeTime': rows[-1][6]})
+        return next((t for t in tickers if t['symbol'] == params['symbol']), {}) if 'symbol' in params else tickers
+
+    async def _account(self, params, received):
+        unrealized = sum(self._unrealized(symbol) for symbol in self.klines)
+        return {'totalWalletBalance': str(self.balance), 'totalUnrealizedProfit': str(unrealized),
+                'assets': [{'asset': 'USDT', 'walletBalance': str(self.balance), 'unrealizedProfit': str(unrealized),
+                            'marginBalance': str(self.balance + unrealized),
+                            'availableBalance': str(self.balance + unrealized)}],
+                'positions': [{'symbol': symbol, 'positionSide': 'BOTH', 'positionAmt': str(position['amount']),
+                               'entryPrice': str(position['entry']), 'unrealizedProfit': str(self._unrealized(symbol)),
+                               'leverage': str(self.leverage[symbol]), 'updateTime': position['time']}
+                              for symbol, position in self.positions.items()]}
+
+    async def _position_risk(self, params, received):
+        return [{'symbol': symbol, 'positionSide': 'BOTH', 'positionAmt': str(position['amount']),
+                 'entryPrice': str(position['entry']), 'markPrice': str(self.price[symbol]),
+                 'unRealizedProfit': str(self._unrealized(symbol)), 'leverage': str(self.leverage[symbol]),
+                 'marginType': 'cross'}
+                for symbol, position in self.positions.items() if params.get('symbol', symbol) == symbol]
+
+    async def _user_trades(self, params, received):
+        if 'fromId' in params:
+            trades = [trade for trade in self.trades.get(params.get('symbol'), [])
+                      if trade['id'] >= int(params['fromId'])]
+        else:
+            trades = [trade for trade in self.trades.get(params.get('symbol'), [])
+                      if int(params.get('startTime', 0)) <= trade['time'] <= int(params.get('endTime', 2 ** 63))]
+        return trades[:int(params.get('limit', 500))]
+
+    async def _leverage(self, params, received):
+        if params.get('symbol') not in self.klines:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        self.leverage[params['symbol']] = int(params['leverage'])
+        return {'symbol': params['symbol'], 'leverage': int(params['leverage']), 'maxNotionalValue': '1000000'}
+
+    async def _open_orders(self, params, received):
+        return [order for symbol, orders in self.open_orders.items() if params.get('symbol', symbol) == symbol
+                for order in orders.values()]
+
+    async def _create_order(self, params, received):
+        return await self.create_order(params, received)
+
+    async def _batch_orders(self, params, received):
+        responses = []
+        batch = params['batchOrders']
+        while not batch.startswith('['):
+            batch = unquote_plus(batch)  # python-binance url-encodes the JSON list before the query is encoded
+        for order_params in json.loads(batch):
+            status, body = await self.create_order({key: str(value) for key, value in order_params.items()},
+                                                   received)
+            responses.append(body)
+        return responses
+
+    async def _cancel_order(self, params, received):
+        return await self.cancel_order(params.get('symbol'), int(params.get('orderId', 0)))
+
+    async def _cancel_orders(self, params, received):
+        responses = []
+        for order_id in json.loads(params.get('orderIdList', '[]')):
+            status, body = await self.cancel_order(params.get('symbol'), int(order_id))
+            responses.append(body)
+        return responses
+
+    async def _listen_key(self, params, received):
+        listen_key = params.get('listenKey') or f"sim{len(self.listen_keys) + 1:060d}"
+        self.listen_keys.add(listen_key)
+        return {'listenKey': listen_key}
+
+    async def _stats(self, params, received):
+        return self.stats()
+
+    # Websockets
+
+    async def market_stream(self, request):
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self.market_clients[ws] = {name for name in request.query.get('streams', '').split('/') if name}
+        self.started.set()
+        async for _ in ws:  # Subscriptions come with the URL, incoming messages are ignored
+            pass
+        self.market_clients.pop(ws, None)
+        return ws
+
+    async def user_stream(self, request):
+        if request.match_info['listen_key'] not in self.listen_keys:
+            raise web.HTTPBadRequest(text='Invalid listen key')
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self.user_clients.add(ws)
+        async for _ in ws:
+            pass
+        self.user_clients.discard(ws)
+        return ws
+
+    def app(self):
+        app = web.Application()
+        routes = [
+            ('GET', '/fapi/v1/ping', self._ping, 1), ('GET', '/fapi/v1/time', self._time, 1),
+            ('GET', '/fapi/v1/exchangeInfo', self._exchange_info, 1), ('GET', '/fapi/v1/klines', self._klines, 5),
+            ('GET', '/fapi/v1/ticker/price', self._ticker_price, 1),
+            ('GET', '/fapi/v1/ticker/24hr', self._ticker_24hr, 1), ('GET', '/fapi/v2/account', self._account, 5),
+            ('GET', '/fapi/v2/positionRisk', self._position_risk, 5),
+            ('GET', '/fapi/v1/openOrders', self._open_orders, 1), ('POST', '/fapi/v1/order', self._create_order, 0),
+            ('POST', '/fapi/v1/batchOrders', self._batch_orders, 5),
+            ('DELETE', '/fapi/v1/order', self._cancel_order, 1),
+            ('DELETE', '/fapi/v1/batchOrders', self._cancel_orders, 1),
+            ('POST', '/fapi/v1/leverage', self._leverage, 1), ('GET', '/fapi/v1/userTrades', self._user_trades, 5),
+        ]
+        for method, path, handler, weight in routes:
+            app.router.add_route(method, path, self._endpoint(handler, weight))
+        for method in ('POST', 'PUT', 'DELETE'):
+            app.router.add_route(method, '/fapi/v1/listenKey', self._endpoint(self._listen_key, 1, False))
+        app.router.add_get('/sim/stats', self._endpoint(self._stats, 0, False))
+        app.router.add_get('/stream', self.market_stream)
+        app.router.add_get('/ws/{listen_key}', self.user_stream)
+        return app
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        """Serve REST and websockets on host:port until cancelled."""
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        print(f"Simulated exchange on http://{host}:{port}, replay starts with the first market stream connection")
+        try:
+            await self.run_replay()
+            await asyncio.Event().wait()  # Keep serving the final state
+        finally:
+            await runner.cleanup()
+
+
+def load_klines(csv_items=(), store=None, symbols=()):
+    """{symbol: 1m klines} from SYMBOL=PATH CSV items and/or a kline store directory."""
+    klines_by_symbol = {}
+    for item in csv_items:
+        symbol, path = item.split('=', 1)
+        klines_by_symbol[symbol] = load_csv_klines(path)
+    if symbols:
+        from async_trading_bot.kline_store import KlineStore
+        for symbol in symbols:
+            stored = KlineStore(store or 'klines', symbol, '1m')
+            klines_by_symbol[symbol] = {**load_store_klines(stored), 'volume': stored.column('volume')}
+    return klines_by_symbol
+
+
+def add_arguments(parser):
+    parser.add_argument('--csv', nargs='*', default=[], metavar='SYMBOL=PATH', help="Binance 1m kline CSV files")
+    parser.add_argument('--store', help="kline store directory")
+    parser.add_argument('--symbols', nargs='*', default=[], help="symbols to load from the kline store")
+    parser.add_argument('--speed', type=float, default=60.0, help="replay speed-up, 0 replays as fast as possible")
+    parser.add_argument('--history', type=int, default=KLINES_LIMIT, help="candles served as history before the replay")
+    parser.add_argument('--balance', type=float, default=10000.0)
+    parser.add_argument('--latency', type=float, default=0.0, help="REST latency in milliseconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="random extra REST latency up to this many ms")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of REST requests answered with errors")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+
+
+def exchange_from_args(args):
+    return SimulatedExchange(load_klines(args.csv, args.store, args.symbols), args.speed, args.history, args.balance,
+                             latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Binance futures exchange replaying recorded 1m klines")
+    add_arguments(parser)
+    args = parser.parse_args()
+    try:
+        asyncio.run(exchange_from_args(args).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
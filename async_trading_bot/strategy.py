@@ -0,0 +1,84 @@
+import asyncio
+
+# MARKET orders placed with newOrderRespType=RESULT come back already FILLED
+ACCEPTED_ORDER_STATUSES = ('NEW', 'PARTIALLY_FILLED', 'FILLED')
+
+
+class EmaCrossoverStrategy:
+    """
+    EMA crossover decisions for one TradingBot.
+
+    evaluate() is called by the bot when a kline of ema_interval closes, or on every update of the open candle
+    with intra_candle enabled. A failed evaluation is retried every `retry_delay` seconds until it succeeds.
+    """
+
+    def __init__(self, trade_bot, intra_candle=False, retry_delay=5):
+        self.trade_bot = trade_bot
+        self.intra_candle = intra_candle
+        self.retry_delay = retry_delay
+        self.last_action = {'side': None}
+        self.balance = 0.0
+        self._lock = asyncio.Lock()
+        self._retry_task = None
+
+    @staticmethod
+    def decide(short_ema, long_ema, last_side):
+        """Return the side to open ('BUY' or 'SELL') or None when nothing is to be done."""
+        if short_ema > long_ema and last_side != 'BUY':
+            return 'BUY'
+        if short_ema < long_ema and last_side != 'SELL':
+            return 'SELL'
+        return None
+
+    async def start(self):
+        self.balance = await self.trade_bot.get_balance('USDT')
+        print(f"{self.trade_bot.symbol} Balance: {self.balance}")
+        # A crossover that is already in place is acted on right away, not at the next candle close
+        await self.evaluate()
+
+    async def on_kline(self, closed):
+        if closed or self.intra_candle:
+            await self.evaluate()
+
+    async def evaluate(self):
+        async with self._lock:
+            short_ema, long_ema = self.trade_bot.current_ema()
+            side = self.decide(short_ema, long_ema, self.last_action['side'])
+            if side is None:
+                return
+            try:
+                await self.open_position(side, short_ema, long_ema)
+            except Exception as e:
+                trade_bot = self.trade_bot
+                trade_bot.notifier.notify(
+                    f"{trade_bot.symbol}: Timeout error when communicating with Binance's API. Retrying. {e}")
+                print(f"{trade_bot.symbol}: Timeout error when communicating with Binance's API. Retrying... {e}")
+                if self._retry_task is None or self._retry_task.done():
+                    self._retry_task = asyncio.create_task(self._retry())
+
+    async def _retry(self):
+        await asyncio.sleep(self.retry_delay)
+        await self.evaluate()
+
+    async def open_position(self, side, short_ema, long_ema):
+        trade_bot = self.trade_bot
+        # A stop move in progress places its stop on the side of trade_bot.side, it ends before that flips
+        await trade_bot.trailing.halt()
+        trade_bot.side = side
+        trade_bot.journal.record('signal', symbol=trade_bot.symbol, side=side, short_ema=short_ema,
+                                 long_ema=long_ema)
+        print(f"Create new {side} order for {trade_bot.symbol}")
+        order_response, stop_loss_response = await trade_bot.futures_create_order_with_stop_loss(
+            trade_bot.leverage, trade_bot.order_size)
+        if stop_loss_response:
+            trade_bot.stop_loss_price = stop_loss_response["stopPrice"]
+        if order_response and order_response['status'] in ACCEPTED_ORDER_STATUSES:
+            self.last_action = order_response
+            print(self.last_action)
+            latest_price = await trade_bot.get_latest_price()
+            # Realized PnL after fees and funding, from the fills booked by the ledger
+            pnl = trade_bot.ledger.summary(trade_bot.symbol)['net']
+            trade_bot.notifier.notify(
+                f"Placed {side} order at {latest_price}. Symbol: {trade_bot.symbol} "
+                f"Qty: {order_response.get('executedQty') or order_response.get('origQty')}, "
+                f"Short EMA: {short_ema}, Long EMA: {long_ema} StopPrice: {trade_bot.stop_loss_price} PnL: {pnl}")
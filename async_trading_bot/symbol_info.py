@@ -0,0 +1,77 @@
+import asyncio
+import math
+import time
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
+
+
+class SymbolInfo:
+    """Trading rules of one futures symbol, taken from the LOT_SIZE, PRICE_FILTER and MIN_NOTIONAL filters."""
+
+    def __init__(self, symbol_info):
+        self.symbol = symbol_info['symbol']
+        filters = {f['filterType']: f for f in symbol_info['filters']}
+        lot_size = filters.get('LOT_SIZE', {})
+        market_lot_size = filters.get('MARKET_LOT_SIZE', lot_size)
+        price_filter = filters.get('PRICE_FILTER', {})
+        min_notional = filters.get('MIN_NOTIONAL', {})
+        self.step_size = Decimal(lot_size.get('stepSize', '1'))
+        self.min_qty = float(lot_size.get('minQty', 0))
+        self.max_market_qty = float(market_lot_size.get('maxQty', 0)) or math.inf
+        self.tick_size = Decimal(price_filter.get('tickSize', '0.01'))
+        # Futures report the minimum notional as "notional", spot as "minNotional"
+        self.min_notional = float(min_notional.get('notional', min_notional.get('minNotional', 0)))
+        self.quantity_precision = self._precision(self.step_size)
+        self.price_precision = self._precision(self.tick_size)
+
+    @staticmethod
+    def _precision(step):
+        return max(0, -step.normalize().as_tuple().exponent)
+
+    def round_quantity(self, quantity):
+        """Round a quantity down to the lot step size, returned as a string ready for the order request."""
+        steps = (Decimal(str(quantity)) / self.step_size).to_integral_value(rounding=ROUND_DOWN)
+        return "{:0.{}f}".format(steps * self.step_size, self.quantity_precision)
+
+    def round_price(self, price):
+        """Round a price to the nearest tick."""
+        ticks = (Decimal(str(price)) / self.tick_size).to_integral_value(rounding=ROUND_HALF_UP)
+        return float(ticks * self.tick_size)
+
+
+class SymbolMetadataCache:
+    """
+    futures_exchange_info indexed by symbol. Loaded once and refreshed in the background every `ttl` seconds,
+    so order sizing and rounding never wait for the exchange info download.
+    """
+
+    def __init__(self, client, ttl=3600):
+        self.client = client
+        self.ttl = ttl
+        self.symbols = {}
+        self.loaded_at = 0.0
+        self._refresh_task = None
+
+    async def load(self):
+        exchange_info = await self.client.futures_exchange_info()
+        self.symbols = {s['symbol']: SymbolInfo(s) for s in exchange_info['symbols']}
+        self.loaded_at = time.monotonic()
+
+    def get(self, symbol):
+        try:
+            return self.symbols[symbol]
+        except KeyError:
+            raise ValueError(f"Information for {symbol} not found in futures exchange info.")
+
+    def start_refresh(self):
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+        return self._refresh_task
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.ttl)
+            try:
+                await self.load()
+            except Exception as e:
+                # Keep serving the previous snapshot, the filters change very rarely
+                print(f"Failed to refresh exchange info: {e}")
@@ -1,18 +1,24 @@
-import json
 import asyncio
+import functools
+import json
 import os
-import math
 import time
-import httpx
-import talib
-import numpy as np
-import websockets
-from binance.client import AsyncClient
 from binance.exceptions import BinanceAPIException
-from dotenv import load_dotenv
-from async_trading_bot.utils import retry_on_fail
-
-load_dotenv()
+from async_trading_bot.aggregator import CandleAggregator
+from async_trading_bot.indicators import EmaEngine
+from async_trading_bot.journal import Ledger, TradeJournal
+from async_trading_bot.metrics import metrics, timed
+from async_trading_bot.notifier import TelegramNotifier
+from async_trading_bot.price_cache import PriceCache
+from async_trading_bot.rate_limiter import RequestScheduler
+from async_trading_bot.symbol_info import SymbolMetadataCache
+from async_trading_bot.trailing import TrailingStopManager
+from async_trading_bot.user_stream import AccountState, UserDataStream
+from async_trading_bot.utils import create_client, sync_server_time
+
+BATCH_SIZE = 10  # Maximum number of orders in one Binance futures batch request
+EMA_SEED_ROWS = 5000  # Stored candles used to seed the EMAs, older ones no longer change the value
+UNKNOWN_ORDER = -2011  # Binance error code of a cancel for an order that is no longer open
 
 
 class TradingBot:
@@ -22,6 +28,7 @@ class TradingBot:
         self.client = None
         self.telegram_api = os.getenv("TELEGRAM_API")
         self.telegram_chat_id = os.getenv("TELEGRAM_CHAT_ID")
+        self.notifier = TelegramNotifier(self.telegram_api, self.telegram_chat_id)
         self.risk_percentage = config["risk_percentage"]
         self.price_increase_trigger = config["price_increase_trigger"]
         self.symbol = config["symbol"]
@@ -34,50 +41,135 @@ class TradingBot:
         self.ema_interval = config["ema_interval"]
         self.leverage = config["leverage"]
         self.order_size = config["order_size"]
+        self.ema_engine = EmaEngine(self.short_ema_period, self.long_ema_period)
+        self.strategy = None  # evaluated on ema_interval kline events, see EmaCrossoverStrategy
+        self.trailing = TrailingStopManager(self, config.get("trailing_stop_mode", "local"),
+                                            config.get("trailing_stop_debounce", 1.0))
+        self.price_cache = PriceCache(self.symbol, config.get("price_max_age", 5.0))
+        self.exchange_info_ttl = config.get("exchange_info_ttl", 3600)
+        self.symbol_metadata = None
+        self.account = AccountState()
+        self.user_stream = None
+        self.leverage_set = None
+        self.fill_timeout = config.get("fill_timeout", 10)
+        # Another exchange than Binance, e.g. the local simulator: "rest_url" and "ws_url"
+        self.rest_url = config.get("rest_url")
+        self.ws_url = config.get("ws_url")
+        self.last_entry_latency = None  # seconds from signal to a stop-loss protected position
+        # Orders, fills, stop moves and signals are journaled when "journal_dir" is configured
+        self.journal = TradeJournal(config.get("journal_dir"), config.get("journal_max_bytes", 64 * 1024 * 1024),
+                                    config.get("journal_keep", 0))
+        self.ledger = Ledger(self.journal)
+        # Closed klines of every subscribed interval on disk, when "kline_store_dir" is configured
+        self.kline_store_history = config.get("kline_store_history", 1500)
+        self.kline_stores = {}
+        self.backfilling = set()
+        if config.get("kline_store_dir"):
+            from async_trading_bot.kline_store import KlineStore  # NumPy is only loaded with a store configured
+            for interval in {"1m", self.ema_interval}:
+                self.kline_stores[interval] = KlineStore(config["kline_store_dir"], self.symbol, interval)
+        # Candles of every interval are built from the 1m stream, indicators are fed per interval
+        self.aggregator = CandleAggregator([self.ema_interval, *self.kline_stores])
+        self.indicators = {self.ema_interval: [self.ema_engine]}
 
     async def init_client(self):
-        self.client = await AsyncClient.create(self.api_key, self.api_secret)
+        # All REST calls go through the scheduler, which handles rate limits and retries
+        client = await create_client(self.api_key, self.api_secret, self.rest_url, sync_time=False)
+        self.client = RequestScheduler(client)
+        self.symbol_metadata = SymbolMetadataCache(self.client, self.exchange_info_ttl)
+        await asyncio.gather(sync_server_time(client), self.symbol_metadata.load(), self.ledger.load())
+        self.symbol_metadata.start_refresh()
+        self.account.order_listeners.append(self.ledger.on_order_update)
+        self.account.update_listeners.append(self.ledger.on_account_update)
+        self.user_stream = UserDataStream(self.client, self.account, base_url=self.ws_url)
+        self.user_stream.sync_listeners.append(functools.partial(self.ledger.sync, self.client, [self.symbol]))
+
+    def attach(self, client, symbol_metadata, user_stream, notifier, journal=None, ledger=None):
+        """
+        Use a client, metadata cache, user data stream, notifier, journal and ledger shared with other bots instead
+        of init_client.
+        """
+        self.client = client
+        self.notifier = notifier
+        self.journal = journal or self.journal
+        self.ledger = ledger or self.ledger
+        self.symbol_metadata = symbol_metadata
+        self.user_stream = user_stream
+        self.account = user_stream.account
+
+    async def start_user_stream(self):
+        """Keep self.account current from the user data stream. Runs forever, start it as a task."""
+        await self.user_stream.start()
+
+    @property
+    def symbol_info(self):
+        return self.symbol_metadata.get(self.symbol)
 
     async def send_telegram_message(self, message):
-        url = f"https://api.telegram.org/bot{self.telegram_api}/sendMessage"
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, params={'chat_id': self.telegram_chat_id, 'text': message})
-                response.raise_for_status()  # Raises an exception for 4XX/5XX responses
-        except httpx.RequestError as e:
-            print(f"Request failed: {e}")
-        except httpx.HTTPStatusError as e:
-            print(f"Error response {e.response.status_code} while sending message: {e}")
-        except Exception as e:
-            print(f"An unexpected error occurred while sending a message: {e}")
-
-    @retry_on_fail()
+        """Queue a Telegram message, returns immediately. Sending happens in the notifier task."""
+        self.notifier.notify(message)
+
+    @timed()
     async def get_latest_price(self):
-        ticker = await self.client.futures_ticker(symbol=self.symbol)
-        return float(ticker['lastPrice'])
+        price = self.price_cache.fresh_price()
+        if price is not None:
+            return price
+        # Stream prices are stale, ask the lightweight price endpoint
+        ticker = await self.client.futures_symbol_ticker(symbol=self.symbol)
+        self.price_cache.set_last(float(ticker['price']))
+        return self.price_cache.last
 
-    @retry_on_fail()
     async def get_balance(self, asset):    # asset='USDT'
+        if self.account.synced:
+            return self.account.balance(asset)
+        return await self.fetch_balance(asset)
+
+    @timed()
+    async def fetch_balance(self, asset):
         account_info = await self.client.futures_account()
         return next((float(a['walletBalance']) for a in account_info['assets'] if a['asset'] == asset), 0.0)
 
-    @retry_on_fail()
-    async def get_historical_data(self, interval):
-        klines = await self.client.futures_klines(symbol=self.symbol, interval=interval)
-        return [float(k[4]) for k in klines]  # closing prices
+    @timed()
+    async def get_historical_klines(self, interval):
+        return await self.client.futures_klines(symbol=self.symbol, interval=interval)
 
-    async def calculate_ema(self, close_prices):
-        short_ema = talib.EMA(np.array(close_prices), timeperiod=self.short_ema_period)[-1]
-        long_ema = talib.EMA(np.array(close_prices), timeperiod=self.long_ema_period)[-1]
-        return short_ema, long_ema
+    async def backfill_kline_store(self, interval):
+        if interval in self.backfilling:
+            return
+        self.backfilling.add(interval)
+        try:
+            await self.kline_stores[interval].backfill(self.client, self.kline_store_history)
+        finally:
+            self.backfilling.discard(interval)
+
+    async def warm_up_indicators(self):
+        """Seed the indicators once, afterwards they are kept up to date from the 1m kline websocket."""
+        # Only the candles missed since the last run are downloaded
+        await asyncio.gather(*(self.backfill_kline_store(interval) for interval in self.kline_stores))
+        await asyncio.gather(*(self.seed_indicators(interval, indicators)
+                               for interval, indicators in self.indicators.items()))
+
+    async def seed_indicators(self, interval, indicators):
+        store = self.kline_stores.get(interval)
+        if store is None:
+            klines = await self.get_historical_klines(interval)
+            for indicator in indicators:
+                indicator.seed(klines)
+            return
+        for indicator in indicators:
+            indicator.seed_closed(store.column('open_time', EMA_SEED_ROWS), store.closes(EMA_SEED_ROWS))
 
-    async def adjust_precision(self, value, precision):
-        format_string = "{:0.0f}"
-        return format_string.format(value, precision)
+    def current_ema(self):
+        """Short and long EMA on ema_interval, including the candle that is still open. No REST call."""
+        return self.ema_engine.values()
+
+    async def adjust_precision(self, value):
+        return self.symbol_info.round_quantity(value)
 
     # Additional methods (calculate_quantity, futures_create_order_with_stop_loss, main logic, etc.) go here
 
     # Takes :param side: Order side ('BUY' or 'SELL').
+    @timed()
     async def get_position_entry_price(self):
         if self.side == "BUY":
             target_position_side = "LONG"  # Assuming LONG for BUY orders
@@ -86,6 +178,9 @@ class TradingBot:
         else:
             raise ValueError(f"Unsupported side provided: {self.side}. Expected 'BUY' or 'SELL'.")
 
+        if self.account.synced:
+            return self.account.position(self.symbol, target_position_side)
+
         try:
             position_info = await self.client.futures_position_information(symbol=self.symbol)
             for pos in position_info:
@@ -102,118 +197,112 @@ class TradingBot:
 
         return None, 0  # Return None explicitly if no matching position or in case of errors
 
-    @retry_on_fail()
     async def precision_for_stop_loss(self):
-        exchange_info = await self.client.futures_exchange_info()
-        symbol_info = None
-        for s in exchange_info['symbols']:
-            if s['symbol'] == self.symbol:
-                symbol_info = s
-                break
-
-        if symbol_info:
-            # For futures, the precision information is inside the filters. Example for lot size (quantity precision):
-            lot_size_filter = next(
-                (filter_ for filter_ in symbol_info['filters'] if filter_['filterType'] == 'LOT_SIZE'),
-                None)
-            quantity_precision = 0
-            price_precision = 0
-            if lot_size_filter:
-                quantity_precision = int(-math.log10(float(lot_size_filter['stepSize'])))
-
-            # Example for price precision:
-            price_filter = next((filter for filter in symbol_info['filters'] if filter['filterType'] == 'PRICE_FILTER'),
-                                None)
-            if price_filter:
-                price_precision = int(-math.log10(float(price_filter['tickSize'])))
-
-            return quantity_precision, price_precision
-        else:
-            print("Symbol not found.")
-
+        symbol_info = self.symbol_info
+        return symbol_info.quantity_precision, symbol_info.price_precision
+
+    @timed()
+    async def get_open_orders(self):
+        if self.account.synced:
+            return self.account.orders(self.symbol)
+        return await self.client.futures_get_open_orders(symbol=self.symbol)
+
+    @timed()
+    async def get_position_amount(self):
+        """Signed position amount of the symbol, positive for long and negative for short."""
+        if self.account.synced:
+            return self.account.position_amount(self.symbol)
+        position_info = await self.client.futures_position_information(symbol=self.symbol)
+        return sum(float(pos['positionAmt']) for pos in position_info if pos['symbol'] == self.symbol)
+
+    @timed()
     async def cancel_stop_loss_orders(self):
         try:
-            # Retrieve all open orders for the symbol
-            open_orders = await self.client.futures_get_open_orders(symbol=self.symbol)
+            # Open orders come from the user data stream book when it is synced
+            open_orders = await self.get_open_orders()
 
             # Filter out stop loss orders
-            stop_loss_orders = [order for order in open_orders if
-                                order['type'] == 'STOP_MARKET' or order['type'] == 'STOP_LOSS_LIMIT']
-
-            # Cancel each stop loss order
-            for order in stop_loss_orders:
-                await self.client.futures_cancel_order(symbol=self.symbol, orderId=order['orderId'])
-                print(f"Cancelled stop loss order {order['orderId']}")
+            stop_loss_ids = [order['orderId'] for order in open_orders if
+                             order['type'] in ('STOP_MARKET', 'STOP_LOSS_LIMIT', 'TRAILING_STOP_MARKET')]
+            # A stop placed by the last trailing move may not be in the stream book yet
+            stop_loss_ids.extend(order_id for order_id in (self.trailing.stop_order_id, self.trailing.trailing_order_id)
+                                 if order_id is not None and order_id not in stop_loss_ids)
+            if len(stop_loss_ids) == 1:
+                try:
+                    await self.client.futures_cancel_order(symbol=self.symbol, orderId=stop_loss_ids[0])
+                except BinanceAPIException as e:
+                    if e.code != UNKNOWN_ORDER:
+                        raise
+                    print(f"Stop loss order {stop_loss_ids[0]} is already gone")  # Filled or expired meanwhile
+            elif stop_loss_ids:
+                # Bulk cancel, at most 10 orders per batch request
+                await asyncio.gather(*(
+                    self.client.futures_cancel_orders(symbol=self.symbol,
+                                                      orderIdList=json.dumps(stop_loss_ids[i:i + BATCH_SIZE]))
+                    for i in range(0, len(stop_loss_ids), BATCH_SIZE)))
+            for order_id in stop_loss_ids:
+                print(f"Cancelled stop loss order {order_id}")
+            if stop_loss_ids:
+                self.journal.record('cancel', symbol=self.symbol, order_ids=stop_loss_ids)
 
         except BinanceAPIException as e:
             print(f"Error cancelling stop loss orders: {e}")
             raise
 
-    async def close_order(self):
-        """Close existing order and manage stop loss based on the side (BUY/SELL)."""
-        try:
-            # Cancel existing stop loss orders before placing a new order.
-            await self.cancel_stop_loss_orders()
+    def close_order_params(self, position_amount):
+        """Reduce-only MARKET order closing the given signed position amount."""
+        return {'symbol': self.symbol, 'side': 'SELL' if position_amount > 0 else 'BUY', 'type': 'MARKET',
+                'quantity': self.symbol_info.round_quantity(abs(position_amount)), 'reduceOnly': 'true'}
 
-            # Fetch current positions to identify the one to close
-            position_info = await self.client.futures_position_information(symbol=self.symbol)
-            for pos in position_info:
-                side = "BUY" if float(pos['positionAmt']) > 0 else "SELL"
-                if (side == 'BUY' and float(pos['positionAmt']) > 0) or (
-                        side == 'SELL' and float(pos['positionAmt']) < 0):
-                    # Calculate the quantity to close based on the position amount
-                    quantity_to_close = abs(float(pos['positionAmt']))
-
-                    # Place an order to close the position
-                    close_position_response = await self.client.futures_create_order(
-                        symbol=self.symbol,
-                        side='SELL' if side == 'BUY' else 'BUY',  # Opposite action to close
-                        type='MARKET',
-                        quantity=quantity_to_close)
-                    print(f"Closed position for {self.symbol} with order: {close_position_response}")
-
-        except BinanceAPIException as e:
-            print(f"Error closing order for {self.symbol}: {e}")
-            raise
+    @timed()
+    async def ensure_leverage(self, leverage):
+        """Change the leverage only when it differs from the last value set by this bot."""
+        if self.leverage_set != leverage:
+            await self.client.futures_change_leverage(symbol=self.symbol, leverage=leverage)
+            self.leverage_set = leverage
 
+    @timed()
     async def calculate_quantity(self, percentage):
-        # Fetch exchange information
-        exchange_info = await self.client.get_exchange_info()
-        if self.symbol == "1000PEPEUSDT":
-            symbol_new = "PEPEUSDT"
-        else:
-            symbol_new = self.symbol
-        pair_info = next((item for item in exchange_info['symbols'] if item['symbol'] == symbol_new), None)
-
-        if not pair_info:
-            raise ValueError(f"Information for {self.symbol} not found. Cannot calculate quantity.")
-
-        # Extracting precision for quantity
-        lot_size_filter = next(filter for filter in pair_info['filters'] if filter['filterType'] == 'LOT_SIZE')
-        quantity_precision = int(-math.log(float(lot_size_filter['stepSize']), 10))
-
         # Assuming all trading pairs are with USDT and calculating based on the wallet balance
-        account_balance = await self.get_balance('USDT')
+        account_balance, latest_price = await asyncio.gather(self.get_balance('USDT'), self.get_latest_price())
         if account_balance == 0:
             raise ValueError("Insufficient balance to place order.")
         # Calculate the desired quantity
-        latest_price = await self.get_latest_price()
         desired_quantity_value = (percentage / 100) * account_balance / latest_price
-        adjusted_quantity = await self.adjust_precision(desired_quantity_value, quantity_precision)
+        if desired_quantity_value > self.symbol_info.max_market_qty:
+            # Binance rejects larger MARKET orders (-4005)
+            print(f"Quantity {desired_quantity_value} is above the market order maximum for {self.symbol}, "
+                  f"using {self.symbol_info.max_market_qty}.")
+            desired_quantity_value = self.symbol_info.max_market_qty
+        adjusted_quantity = await self.adjust_precision(desired_quantity_value)
+        if float(adjusted_quantity) < self.symbol_info.min_qty:
+            raise ValueError(f"Quantity {adjusted_quantity} is below the minimum for {self.symbol}.")
+        if float(adjusted_quantity) * latest_price < self.symbol_info.min_notional:
+            raise ValueError(f"Order value of {adjusted_quantity} {self.symbol} at {latest_price} is below the "
+                             f"minimum notional of {self.symbol_info.min_notional}.")
         return adjusted_quantity
 
-    @retry_on_fail()
+    async def confirm_fill(self, order_response):
+        """Return (average fill price, filled quantity) of the entry order without polling the position."""
+        if order_response['status'] == 'FILLED' and float(order_response.get('avgPrice', 0)) > 0:
+            return float(order_response['avgPrice']), float(order_response['executedQty'])
+        if self.account.synced:
+            fill = await self.account.wait_for_fill(order_response['orderId'], self.fill_timeout)
+            if fill:
+                return fill
+        return await self.get_position_entry_price()
+
+    @timed()
     async def futures_create_order_with_stop_loss(self, leverage: int, percentage: float,
                                             order_type: str = 'MARKET', price: float = None,
                                             time_in_force: str = 'GTC'):
         """
-        Places a futures order and sets a stop-loss order on Binance Futures.
+        Closes the opposite position, places a futures order and sets a stop-loss order on Binance Futures.
 
         Required Parameters:
         :param side: Order side ('BUY' or 'SELL').
         :param leverage: The leverage for the futures order.
         :param percentage: The percentage of the balance.
-        :param stop_loss_price: The price at which to trigger the stop loss.
 
         Optional Parameters:
         :param order_type: Type of the primary order ('MARKET' or 'LIMIT'). Default is 'MARKET'.
@@ -221,34 +310,49 @@ class TradingBot:
         :param time_in_force: Time in force for the order (e.g., 'GTC' for Good Till Cancel). Relevant for limit orders.
         """
         try:
-            # Set the leverage for the symbol
-            await self.client.futures_change_leverage(symbol=self.symbol, leverage=leverage)
-
-            quantity = await self.calculate_quantity(percentage)
-
-            timestamp = int(time.time() * 1000)
-
-            # Place the primary futures order
-            if order_type == 'MARKET':
-                order_response = await self.client.futures_create_order(symbol=self.symbol, side=self.side, type=order_type,
-                                                                  quantity=quantity,
-                                                                  timestamp=timestamp)
-            elif order_type == 'LIMIT':
+            started = time.perf_counter()
+            await self.trailing.halt()  # The stops of the old position are cancelled below
+            # Independent requests run concurrently: stop cancel, leverage, position and quantity lookups
+            _, _, position_amount, quantity = await asyncio.gather(
+                self.cancel_stop_loss_orders(), self.ensure_leverage(leverage), self.get_position_amount(),
+                self.calculate_quantity(percentage))
+
+            # RESULT makes MARKET orders return the fill price, so no need to poll the position afterwards
+            order_params = {'symbol': self.symbol, 'side': self.side, 'type': order_type, 'quantity': quantity,
+                            'newOrderRespType': 'RESULT'}
+            if order_type == 'LIMIT':
                 assert price is not None, "Price must be specified for LIMIT orders."
-                order_response = await self.client.futures_create_order(symbol=self.symbol, side=self.side, type=order_type,
-                                                                  quantity=quantity,
-                                                                  timestamp=timestamp,
-                                                                  price=price, timeInForce=time_in_force)
-            else:
+                order_params.update(price=price, timeInForce=time_in_force)
+            elif order_type != 'MARKET':
                 raise ValueError("Unsupported order type provided.")
+
+            if position_amount != 0:
+                # Closed before the entry is sent, not in one batch request: Binance matches the orders of a batch
+                # in no fixed order, and with the entry filled first the reduce-only close would leave it flat
+                close_response = await self.client.futures_create_order(**self.close_order_params(position_amount))
+                print(f"Closed position for {self.symbol} with order: {close_response}")
+                self.journal.record('order', symbol=self.symbol, role='close', order=close_response)
+            order_response = await self.client.futures_create_order(**order_params)
             print(f"Order placed: {order_response}")
-            await asyncio.sleep(2)
+            self.journal.record('order', symbol=self.symbol, role='entry', order=order_response)
+            order_acked = time.perf_counter()
+
             self.is_position_open = True
-            entry_price, position_size = await self.get_position_entry_price()
+            entry_price, position_size = await self.confirm_fill(order_response)
+            if not entry_price:
+                print(f"Order {order_response['orderId']} is not filled yet, no stop-loss placed.")
+                return order_response, None
             stop_loss_price = entry_price * (1 - self.risk_percentage if self.side == 'BUY' else 1 + self.risk_percentage)
             print(stop_loss_price)
 
             stop_loss_response = await self.create_stop_loss_order(stop_loss_price, position_size)
+            self.last_entry_latency = time.perf_counter() - started
+            metrics.observe('signal_to_order_ack_seconds', order_acked - started, symbol=self.symbol)
+            metrics.observe('order_ack_to_stop_seconds', time.perf_counter() - order_acked, symbol=self.symbol)
+            print(f"Signal to protected position for {self.symbol}: {self.last_entry_latency * 1000:.1f} ms "
+                  f"(order ack {(order_acked - started) * 1000:.1f} ms)")
+            if stop_loss_response:
+                await self.trailing.start(self.side, entry_price, stop_loss_response, position_size)
             return order_response, stop_loss_response
 
         except BinanceAPIException as e:
@@ -258,22 +362,24 @@ class TradingBot:
             print(f"Assertion Error: {e}")
             raise
 
-    @retry_on_fail()
+    @timed()
     async def create_stop_loss_order(self, new_stop_loss_price, position_size):
         if not self.is_position_open or self.side is None:
             print("No open position to set a stop-loss order for.")
             return
         try:
-            quantity_precision, price_precision = await self.precision_for_stop_loss()
-            adjusted_stop_loss_price = round(new_stop_loss_price, price_precision)
+            symbol_info = self.symbol_info
+            adjusted_stop_loss_price = symbol_info.round_price(new_stop_loss_price)
             stop_loss_response = await self.client.futures_create_order(
                 symbol=self.symbol,
                 side='SELL' if self.side == 'BUY' else 'BUY',  # Opposite action for stop-loss
                 type='STOP_MARKET',
-                quantity=round(float(position_size), quantity_precision),  # Adjust as necessary for partial stop losses
-                stopPrice=adjusted_stop_loss_price
+                quantity=symbol_info.round_quantity(position_size),  # Adjust as necessary for partial stop losses
+                stopPrice=adjusted_stop_loss_price,
+                reduceOnly='true'  # Never opens a position, also not while an old stop is still being replaced
             )
             print(f"Stop-loss order placed: {stop_loss_response}")
+            self.journal.record('order', symbol=self.symbol, role='stop', order=stop_loss_response)
             await self.send_telegram_message(f"Stop-loss order placed. Stop loss price: {adjusted_stop_loss_price}")
             return stop_loss_response
 
@@ -284,72 +390,55 @@ class TradingBot:
             print(f"Assertion Error: {e}")
             raise
 
-    async def adjust_stop_loss_on_exchange(self, new_stop_loss_price, position_size):
-        """Adjust the stop loss order to the new price."""
-        # Example: Cancel the existing stop loss order (you'll need its order ID)
-        await self.cancel_stop_loss_orders()
-        await asyncio.sleep(2)
+    @timed()
+    async def adjust_stop_loss_on_exchange(self, new_stop_loss_price, position_size, old_order_id=None):
+        """
+        Move the stop loss to the new price. The new stop is placed before the old one is cancelled, so the position
+        is never unprotected. Without old_order_id every other stop order of the symbol is cancelled.
+        """
         stop_loss_resp = await self.create_stop_loss_order(new_stop_loss_price, position_size)
-        print(f"Updated stop loss order with new price: {new_stop_loss_price} Stop-loss order placed: {stop_loss_resp}")
-
-    async def start_websocket(self):
-        while True:  # Keep attempting to reconnect if the connection is lost
-            try:
-                async with websockets.connect(f'wss://fstream.binance.com/ws/{self.symbol.lower()}@kline_1m') as ws:
-                    await self.process_websocket_messages(ws)
-            except websockets.exceptions.ConnectionClosed as e:
-                print(f"WebSocket connection closed: {e}")
-                await asyncio.sleep(7)  # Wait before attempting to reconnect
-            except Exception as e:
-                print(f"An error occurred: {e}")
-                await asyncio.sleep(7)  # Wait before attempting to reconnect
-
-    async def process_websocket_messages(self, ws):
-        async for message in ws:
+        if old_order_id is not None:
+            stale_ids = [old_order_id]
+        else:
+            stale_ids = [order['orderId'] for order in await self.get_open_orders()
+                         if order['type'] == 'STOP_MARKET' and order['orderId'] != stop_loss_resp['orderId']]
+        for order_id in stale_ids:
             try:
-                if not self.is_position_open:
-                    return
-                data = json.loads(message)
-                new_stop_loss_price = 0.0
-                if data.get('e') == 'error':
-                    print(f"Websocket error {data.get('m')}")
-                    return
-                if data.get('e') == 'kline':
-                    entry_price, position_size = await self.get_position_entry_price()
-                    self.current_price = float(data['k']['c'])
-
-                    if position_size == 0:
-                        return  # No open position, nothing to adjust.
-
-                    if self.side == 'BUY':
-                        # For a long position, adjust stop loss if the current price is significantly higher than entry.
-                        if self.current_price >= entry_price * (1 + self.price_increase_trigger):
-                            new_stop_loss_price = self.current_price - (self.current_price * self.risk_percentage)
-                            if new_stop_loss_price != self.stop_loss_price and new_stop_loss_price > 0:
-                                print(
-                                    f"Entry price: {entry_price}, Current_price: {self.current_price} New stop loss: {new_stop_loss_price} | "
-                                    f"if {self.current_price} >= {entry_price * (1 + self.price_increase_trigger)}")
-                                self.price_increase_trigger += 0.06
-                                await self.adjust_stop_loss_on_exchange(new_stop_loss_price, abs(position_size))
-                                self.stop_loss_price = new_stop_loss_price  # Update the stop price for subsequent adjustments.
-                                print(f"New stop loss: {self.stop_loss_price}")
-                            else:
-                                print(f"Invalid stop-loss price calculated: {new_stop_loss_price}")
-
-                    elif self.side == 'SELL':
-                        # For a short position, adjust stop loss if the current price is significantly lower than entry.
-                        if self.current_price <= entry_price * (1 - self.price_increase_trigger):
-                            new_stop_loss_price = self.current_price + (self.current_price * self.risk_percentage)
-                            if new_stop_loss_price != self.stop_loss_price and new_stop_loss_price > 0:
-                                print(
-                                    f"Entry price: {entry_price}, Current_price: {self.current_price} New stop loss: {new_stop_loss_price} | "
-                                    f"if {self.current_price} >= {entry_price * (1 + self.price_increase_trigger)}")
-                                self.price_increase_trigger += 0.06
-                                await self.adjust_stop_loss_on_exchange(new_stop_loss_price, abs(position_size))
-                                self.stop_loss_price = new_stop_loss_price  # Update the stop price for subsequent adjustments.
-                                print(f"New stop loss: {self.stop_loss_price}")
-                            else:
-                                print(f"Invalid stop-loss price calculated: {new_stop_loss_price}")
-
-            except json.JSONDecodeError as e:
-                print(f"Error decoding message: {e}")
+                await self.client.futures_cancel_order(symbol=self.symbol, orderId=order_id)
+            except BinanceAPIException as e:
+                if e.code != UNKNOWN_ORDER:
+                    raise
+                print(f"Stop loss order {order_id} is already gone")  # Filled or expired meanwhile
+        print(f"Updated stop loss order with new price: {new_stop_loss_price} Stop-loss order placed: {stop_loss_resp}")
+        if stop_loss_resp:
+            self.journal.record('stop_move', symbol=self.symbol, stop_price=stop_loss_resp['stopPrice'],
+                                order_id=stop_loss_resp['orderId'], replaced=stale_ids)
+        return stop_loss_resp
+
+    def market_streams(self):
+        symbol = self.symbol.lower()
+        # Other intervals are aggregated from kline_1m, see CandleAggregator
+        return [f"{symbol}@kline_1m", f"{symbol}@bookTicker", f"{symbol}@markPrice@1s"]
+
+    async def handle_market_event(self, data):
+        if data.get('e') == 'kline' and data['k']['i'] == '1m':
+            for kline in (data['k'], *self.aggregator.on_kline(data['k'])):
+                await self.on_candle(kline)
+        if not self.is_position_open:
+            return
+        if data.get('e') == 'kline' and data['k']['i'] == '1m':
+            self.current_price = float(data['k']['c'])
+            # One comparison with the precomputed trigger price, the exchange is only called when it is crossed
+            await self.trailing.on_price(self.current_price)
+
+    async def on_candle(self, kline):
+        """Kline payload of the 1m stream or of an interval aggregated from it."""
+        interval = kline['i']
+        if kline['x'] and interval in self.kline_stores:
+            # A candle missing some of its minutes (e.g. the first after a start) is downloaded instead
+            if not kline.get('complete', True) or not self.kline_stores[interval].append_ws_kline(kline):
+                asyncio.create_task(self.backfill_kline_store(interval))
+        for indicator in self.indicators.get(interval, ()):
+            indicator.on_kline(int(kline['t']), float(kline['c']), kline['x'])
+        if interval == self.ema_interval and self.strategy is not None:
+            await self.strategy.on_kline(kline['x'])
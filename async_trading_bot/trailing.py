@@ -0,0 +1,195 @@
+import asyncio
+import time
+from binance.exceptions import BinanceAPIException
+from async_trading_bot.rate_limiter import RETRYABLE_CODES
+
+TRIGGER_STEP = 0.06  # The trigger distance from the entry grows by this after every stop move
+# Binance futures TRAILING_STOP_MARKET callbackRate limits, in percent
+MIN_CALLBACK_RATE = 0.1
+MAX_CALLBACK_RATE = 5.0
+
+
+class TrailingStopManager:
+    """
+    Trailing stop of the position of one TradingBot.
+
+    "local" mode is a ratchet: the price that moves the stop next (price_increase_trigger from the entry) is
+    computed once per step, so a price update costs one comparison and the exchange is only called when it is
+    crossed. The stop then moves to risk_percentage from the price, placing the new stop before cancelling the old
+    one so the position is never without a stop. Moves are at most one per `debounce` seconds, crossings in between
+    only raise the pending stop. A move the exchange rejects is dropped, the next crossing moves the stop again.
+    Two REST calls per step.
+
+    "native" mode adds a TRAILING_STOP_MARKET order next to the entry stop, activated at the first trigger price and
+    trailing at risk_percentage, so Binance moves the stop and no REST call is made per step. A position whose
+    trailing order is rejected falls back to the local ratchet.
+    """
+
+    def __init__(self, trade_bot, mode='local', debounce=1.0):
+        if mode not in ('local', 'native'):
+            raise ValueError(f"Unsupported trailing stop mode: {mode}. Expected 'local' or 'native'.")
+        self.trade_bot = trade_bot
+        self.mode = mode
+        self.native = False  # The current position is trailed by a TRAILING_STOP_MARKET order
+        self.debounce = debounce
+        self.active = False
+        self.side = None
+        self.entry_price = None
+        self.stop_price = None
+        self.stop_order_id = None
+        self.trailing_order_id = None
+        self.trigger = None
+        self.next_trigger_price = None
+        self.pending_stop = None
+        self.last_move = 0.0  # time.monotonic() of the last stop move
+        self.moves = 0
+        self._task = None
+        self._sending = False  # The stop move task waits for the exchange
+        self._cleanup = None  # Task cancelling the other stop order once one filled
+        self._listening = None  # AccountState the fill listener is registered with
+
+    async def start(self, side, entry_price, stop_loss_response, position_size):
+        """
+        Track a new position of `position_size` (the confirmed fill, the account book may not have it yet),
+        protected by the STOP_MARKET order of stop_loss_response.
+        """
+        await self.halt()
+        trade_bot = self.trade_bot
+        self.side = side
+        self.entry_price = entry_price
+        self.stop_price = float(stop_loss_response['stopPrice'])
+        self.stop_order_id = stop_loss_response['orderId']
+        self.trailing_order_id = None
+        self.trigger = trade_bot.price_increase_trigger  # Every position starts from the configured trigger
+        self.pending_stop = None
+        self.moves = 0
+        self._set_next_trigger()
+        self.active = True
+        if self._listening is not trade_bot.account:
+            trade_bot.account.order_listeners.append(self.on_order_update)
+            self._listening = trade_bot.account
+        self.native = False
+        if self.mode == 'native':
+            try:
+                await self._place_native(position_size)
+                self.native = True
+            except Exception as e:
+                print(f"Trailing stop order for {trade_bot.symbol} failed, trailing locally instead: {e}")
+
+    def stop(self):
+        self.active = False
+        self.pending_stop = None
+
+    async def halt(self):
+        """
+        Stop and wait for a stop move in progress, so the caller can change the stop orders. A move waiting for
+        the debounce interval is cancelled, one already sent to the exchange is awaited so its order is known.
+        """
+        self.stop()
+        task, self._task = self._task, None
+        if task is None or task.done():
+            return
+        if not self._sending:
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    def _set_next_trigger(self):
+        direction = 1 if self.side == 'BUY' else -1
+        self.next_trigger_price = self.entry_price * (1 + direction * self.trigger)
+
+    def _better(self, new_stop, stop):
+        return stop is None or (new_stop > stop if self.side == 'BUY' else new_stop < stop)
+
+    async def on_price(self, price):
+        if not self.active or self.native:
+            return
+        if self.side == 'BUY' and price < self.next_trigger_price:
+            return
+        if self.side == 'SELL' and price > self.next_trigger_price:
+            return
+        risk = self.trade_bot.risk_percentage
+        new_stop = price * (1 - risk) if self.side == 'BUY' else price * (1 + risk)
+        print(f"{self.trade_bot.symbol} entry price: {self.entry_price}, price: {price} crossed "
+              f"{self.next_trigger_price}, new stop loss: {new_stop}")
+        if self._better(new_stop, self.pending_stop or self.stop_price):
+            self.pending_stop = new_stop
+        self.trigger += TRIGGER_STEP
+        self._set_next_trigger()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._move_stop())
+
+    async def _move_stop(self):
+        trade_bot = self.trade_bot
+        while self.active and self.pending_stop is not None:
+            wait = self.last_move + self.debounce - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                if not self.active or self.pending_stop is None:
+                    return  # Stopped or restarted meanwhile
+            new_stop, self.pending_stop = self.pending_stop, None
+            self._sending = True
+            try:
+                position_amount = await trade_bot.get_position_amount()
+                if position_amount == 0:
+                    print(f"{trade_bot.symbol} position is closed, trailing stop stopped.")
+                    self.stop()
+                    return
+                response = await trade_bot.adjust_stop_loss_on_exchange(new_stop, abs(position_amount),
+                                                                        self.stop_order_id)
+            except Exception as e:
+                self.last_move = time.monotonic()
+                if isinstance(e, BinanceAPIException) and e.status_code < 500 and e.code not in RETRYABLE_CODES:
+                    # Rejected for this price (e.g. -2021, it would trigger immediately), a retry fails the same
+                    # way. The old stop stays, the next trigger crossing moves it again.
+                    print(f"Stop loss move of {trade_bot.symbol} to {new_stop} rejected: {e}")
+                    continue
+                print(f"Failed to move the stop loss of {trade_bot.symbol} to {new_stop}: {e}")
+                if self._better(new_stop, self.pending_stop):
+                    self.pending_stop = new_stop  # Retried after the debounce interval
+                continue
+            finally:
+                self._sending = False
+            self.last_move = time.monotonic()
+            if response:
+                self.stop_price = float(response['stopPrice'])
+                self.stop_order_id = response['orderId']
+                trade_bot.stop_loss_price = self.stop_price
+                self.moves += 1
+
+    async def _place_native(self, position_size):
+        trade_bot = self.trade_bot
+        symbol_info = trade_bot.symbol_info
+        callback_rate = min(max(round(trade_bot.risk_percentage * 100, 1), MIN_CALLBACK_RATE), MAX_CALLBACK_RATE)
+        response = await trade_bot.client.futures_create_order(
+            symbol=trade_bot.symbol, side='SELL' if self.side == 'BUY' else 'BUY', type='TRAILING_STOP_MARKET',
+            quantity=symbol_info.round_quantity(position_size),
+            activationPrice=symbol_info.round_price(self.next_trigger_price), callbackRate=callback_rate,
+            reduceOnly='true')
+        self.trailing_order_id = response['orderId']
+        trade_bot.journal.record('order', symbol=trade_bot.symbol, role='trailing', order=response)
+        print(f"Trailing stop placed for {trade_bot.symbol}: activation {response.get('activatePrice')}, "
+              f"callback rate {callback_rate}%")
+
+    def on_order_update(self, order):
+        """
+        AccountState order listener, the position is gone once one of its stops filled. The other one (the entry
+        stop or the trailing order) is cancelled, it would otherwise stay open.
+        """
+        if order['s'] != self.trade_bot.symbol or order['X'] != 'FILLED' or \
+                order['i'] not in (self.stop_order_id, self.trailing_order_id):
+            return
+        self.stop()
+        other = self.trailing_order_id if order['i'] == self.stop_order_id else self.stop_order_id
+        self.stop_order_id = self.trailing_order_id = None
+        if other is not None:
+            self._cleanup = asyncio.create_task(self._cancel_order(other))
+
+    async def _cancel_order(self, order_id):
+        trade_bot = self.trade_bot
+        try:
+            await trade_bot.client.futures_cancel_order(symbol=trade_bot.symbol, orderId=order_id)
+        except Exception as e:
+            print(f"Failed to cancel the remaining stop order {order_id} of {trade_bot.symbol}: {e}")
+            return
+        print(f"Cancelled the remaining stop order {order_id} of {trade_bot.symbol}")
+        trade_bot.journal.record('cancel', symbol=trade_bot.symbol, order_ids=[order_id])
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import time
+import websockets
+from collections import OrderedDict
+
+USER_STREAM_URL = "wss://fstream.binance.com/ws/"
+OPEN_ORDER_STATUSES = ('NEW', 'PARTIALLY_FILLED')
+RECENT_FILLS = 256  # Fills remembered for wait_for_fill calls that start after the event arrived
+# The snapshot time is an estimate of the server clock (off by about half a time sync round trip), events up to this
+# much older than it are applied as well
+SNAPSHOT_TOLERANCE_MS = 3000
+
+
+class AccountState:
+    """
+    Local copy of the futures account: wallet balances, positions and open orders.
+
+    Filled from a REST snapshot on every (re)connect of the user data stream and then kept current by the
+    ACCOUNT_UPDATE / ORDER_TRADE_UPDATE events, so reads are plain dictionary lookups.
+    """
+
+    def __init__(self):
+        self.synced = False
+        self.balances = {}  # asset -> wallet balance
+        # (symbol, positionSide) -> {'amount', 'entry_price', 'unrealized_profit', 'update_time'}
+        self.positions = {}
+        self.open_orders = {}  # symbol -> {orderId: order}
+        self.snapshot_time = 0  # ms server time of the REST snapshot, older events are ignored (see reconcile)
+        self.order_listeners = []  # callables receiving every ORDER_TRADE_UPDATE order payload
+        self.update_listeners = []  # callables receiving every ACCOUNT_UPDATE payload ('a')
+        self.fills = OrderedDict()  # orderId -> (average price, filled quantity) of recently filled orders
+        self._fill_waiters = {}  # orderId -> future
+
+    def reconcile(self, account_info, open_orders, snapshot_time):
+        """
+        Replace the state with a REST snapshot requested at `snapshot_time` (ms, server clock). Events from
+        SNAPSHOT_TOLERANCE_MS before that time on are applied again on top of it: they carry absolute values, so
+        applying one twice is harmless, while one that arrived during the request and is not in the snapshot would
+        otherwise be lost.
+        """
+        self.balances = {a['asset']: float(a['walletBalance']) for a in account_info['assets']}
+        self.positions = {}
+        for pos in account_info['positions']:
+            self._set_position(pos['symbol'], pos['positionSide'], pos['positionAmt'], pos['entryPrice'],
+                               pos.get('unrealizedProfit', 0), pos.get('updateTime'))
+        self.open_orders = {}
+        for order in open_orders:
+            self.open_orders.setdefault(order['symbol'], {})[order['orderId']] = order
+        self.snapshot_time = snapshot_time
+        self.synced = True
+
+    def balance(self, asset):
+        return self.balances.get(asset, 0.0)
+
+    def position(self, symbol, position_side):
+        """Return (entry_price, abs(position amount)) like TradingBot.get_position_entry_price."""
+        for side in (position_side, 'BOTH'):
+            pos = self.positions.get((symbol, side))
+            if pos and pos['amount'] != 0:
+                return pos['entry_price'], abs(pos['amount'])
+        return None, 0
+
+    def position_amount(self, symbol):
+        """Signed position amount over all position sides."""
+        return sum(pos['amount'] for (s, _), pos in self.positions.items() if s == symbol)
+
+    def position_update_time(self, symbol):
+        """ms of the last change of the position of `symbol`, None when the snapshot did not report it."""
+        times = [pos['update_time'] for (s, _), pos in self.positions.items() if s == symbol]
+        return None if not times or None in times else max(times)
+
+    def orders(self, symbol):
+        return list(self.open_orders.get(symbol, {}).values())
+
+    async def wait_for_fill(self, order_id, timeout):
+        """Wait for the FILLED event of an order, return (average price, filled quantity) or None on timeout."""
+        if order_id in self.fills:
+            return self.fills[order_id]
+        waiter = self._fill_waiters.setdefault(order_id, asyncio.get_running_loop().create_future())
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            self._fill_waiters.pop(order_id, None)
+            return None
+
+    def on_event(self, data):
+        if data.get('E', 0) < self.snapshot_time - SNAPSHOT_TOLERANCE_MS:
+            return
+        event = data.get('e')
+        if event == 'ACCOUNT_UPDATE':
+            update = data['a']
+            for balance in update.get('B', []):
+                self.balances[balance['a']] = float(balance['wb'])
+            for pos in update.get('P', []):
+                self._set_position(pos['s'], pos['ps'], pos['pa'], pos['ep'], pos['up'], data.get('T', data['E']))
+            for listener in self.update_listeners:
+                listener(update)
+        elif event == 'ORDER_TRADE_UPDATE':
+            self._on_order_update(data['o'])
+
+    def _on_order_update(self, o):
+        orders = self.open_orders.setdefault(o['s'], {})
+        if o['X'] in OPEN_ORDER_STATUSES:
+            # Keep the REST field names so the book can be used wherever futures_get_open_orders was
+            orders[o['i']] = {'symbol': o['s'], 'orderId': o['i'], 'clientOrderId': o['c'], 'side': o['S'],
+                              'type': o['o'], 'status': o['X'], 'origQty': o['q'], 'stopPrice': o['sp'],
+                              'positionSide': o['ps']}
+        else:
+            orders.pop(o['i'], None)
+        if o['X'] == 'FILLED':
+            fill = (float(o['ap']), float(o['z']))
+            self.fills[o['i']] = fill
+            if len(self.fills) > RECENT_FILLS:
+                self.fills.popitem(last=False)
+            waiter = self._fill_waiters.pop(o['i'], None)
+            if waiter and not waiter.done():
+                waiter.set_result(fill)
+        for listener in self.order_listeners:
+            listener(o)
+
+    def _set_position(self, symbol, position_side, amount, entry_price, unrealized_profit, update_time=None):
+        self.positions[(symbol, position_side)] = {'amount': float(amount), 'entry_price': float(entry_price),
+                                                   'unrealized_profit': float(unrealized_profit),
+                                                   'update_time': update_time}
+
+
+class UserDataStream:
+    """Binance futures user data stream: listenKey with keepalive, REST reconciliation on every connect."""
+
+    def __init__(self, client, account, keepalive_interval=30 * 60, base_url=None):
+        self.url = f"{base_url.rstrip('/')}/ws/" if base_url else USER_STREAM_URL
+        self.client = client
+        self.account = account
+        self.keepalive_interval = keepalive_interval
+        self.ready = asyncio.Event()  # Set while connected with a reconciled account
+        # Coroutine functions awaited with (account, snapshot_time) after every snapshot, before ready is set
+        self.sync_listeners = []
+
+    async def reconcile(self):
+        # Event times are server times, the cutoff is taken before the requests are sent
+        snapshot_time = int(time.time() * 1000 + getattr(self.client, 'timestamp_offset', 0))
+        account_info, open_orders = await asyncio.gather(self.client.futures_account(),
+                                                         self.client.futures_get_open_orders())
+        self.account.reconcile(account_info, open_orders, snapshot_time)
+
+    async def start(self):
+        while True:  # Keep attempting to reconnect if the connection is lost
+            keepalive_task = None
+            try:
+                listen_key = await self.client.futures_stream_get_listen_key()
+                async with websockets.connect(self.url + listen_key) as ws:
+                    keepalive_task = asyncio.create_task(self._keepalive(listen_key))
+                    # Snapshot after subscribing, so nothing between the snapshot and the first event is lost
+                    await self.reconcile()
+                    for listener in self.sync_listeners:
+                        await listener(self.account, self.account.snapshot_time)
+                    self.ready.set()
+                    await self.process_messages(ws)
+            except websockets.exceptions.ConnectionClosed as e:
+                print(f"User data stream closed: {e}")
+            except Exception as e:
+                print(f"User data stream error: {e}")
+            finally:
+                self.account.synced = False
+                self.ready.clear()
+                if keepalive_task:
+                    keepalive_task.cancel()
+            await asyncio.sleep(2)  # Wait before attempting to reconnect
+
+    async def process_messages(self, ws):
+        async for message in ws:
+            try:
+                data = json.loads(message)
+            except json.JSONDecodeError as e:
+                print(f"Error decoding user data message: {e}")
+                continue
+            if data.get('e') == 'listenKeyExpired':
+                print("Listen key expired, reconnecting user data stream")
+                return
+            self.account.on_event(data)
+
+    async def _keepalive(self, listen_key):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            try:
+                await self.client.futures_stream_keepalive(listenKey=listen_key)
+            except Exception as e:
+                print(f"Failed to keep the listen key alive: {e}")
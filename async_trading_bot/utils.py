@@ -1,10 +1,16 @@
-import time
-from requests.exceptions import RequestException
-from binance.exceptions import BinanceAPIException
-import asyncio
-import functools
 import aiofiles
 import json
+import time
+
+
+MINUTE_MS = 60 * 1000
+# Length of the fixed size Binance kline intervals in milliseconds ("1M" has no fixed length)
+INTERVAL_MS = {
+    '1m': MINUTE_MS, '3m': 3 * MINUTE_MS, '5m': 5 * MINUTE_MS, '15m': 15 * MINUTE_MS, '30m': 30 * MINUTE_MS,
+    '1h': 60 * MINUTE_MS, '2h': 120 * MINUTE_MS, '4h': 240 * MINUTE_MS, '6h': 360 * MINUTE_MS,
+    '8h': 480 * MINUTE_MS, '12h': 720 * MINUTE_MS, '1d': 1440 * MINUTE_MS, '3d': 3 * 1440 * MINUTE_MS,
+    '1w': 7 * 1440 * MINUTE_MS,
+}
 
 
 async def load_config_async(path):
@@ -14,46 +20,41 @@ async def load_config_async(path):
         return config
 
 
-def retry_on_fail(attempts=3, delay=2):
+def expand_symbol_configs(config):
     """
-    This version of the retry_on_fail decorator checks if the function it decorates is an asynchronous coroutine
-    function using asyncio.iscoroutinefunction(func). Based on this check, it returns the appropriate wrapper function:
+    Return one config per traded symbol.
 
-    wrapper_async for async functions, utilizing await for both the function call and the sleep delay.
-    wrapper_sync for synchronous functions, using standard blocking time.sleep for delays.
+    A config with a "symbols" list trades every entry. An entry is either a symbol name or a dict with "symbol"
+    and overrides of the top level keys (short_ema_period, leverage, risk_percentage, ...). A config without
+    "symbols" trades its single "symbol".
     """
+    if "symbols" not in config:
+        return [config]
+    defaults = {key: value for key, value in config.items() if key != "symbols"}
+    symbol_configs = []
+    for entry in config["symbols"]:
+        overrides = {"symbol": entry} if isinstance(entry, str) else entry
+        symbol_configs.append({**defaults, **overrides})
+    return symbol_configs
 
-    def decorator(func):
-        @functools.wraps(func)
-        async def wrapper_async(*args, **kwargs):
-            for attempt in range(attempts):
-                try:
-                    if asyncio.iscoroutinefunction(func):
-                        return await func(*args, **kwargs)
-                    else:
-                        return func(*args, **kwargs)
-                except (BinanceAPIException, RequestException) as e:
-                    print(f"Attempt {attempt + 1} failed for {func.__name__}: {e}")
-                    if attempt < attempts - 1:
-                        await asyncio.sleep(delay)  # Use asyncio.sleep for async functions
-                    else:
-                        raise
-
-        @functools.wraps(func)
-        def wrapper_sync(*args, **kwargs):
-            for attempt in range(attempts):
-                try:
-                    return func(*args, **kwargs)
-                except (BinanceAPIException, RequestException) as e:
-                    print(f"Attempt {attempt + 1} failed for {func.__name__}: {e}")
-                    if attempt < attempts - 1:
-                        time.sleep(delay)
-                    else:
-                        raise
-
-        if asyncio.iscoroutinefunction(func):
-            return wrapper_async
-        else:
-            return wrapper_sync
-
-    return decorator
+
+async def create_client(api_key, api_secret, rest_url=None, sync_time=True):
+    """
+    AsyncClient for Binance futures, or for the exchange at `rest_url` (e.g. http://127.0.0.1:8765 for the
+    simulator). Unlike AsyncClient.create there is no ping, the clock offset comes from one futures time request.
+    With sync_time=False nothing is requested, call sync_server_time before the first signed request.
+    """
+    from binance.client import AsyncClient
+    client = AsyncClient(api_key, api_secret)
+    if rest_url:
+        client.FUTURES_URL = rest_url.rstrip('/') + '/fapi'
+    if sync_time:
+        await sync_server_time(client)
+    return client
+
+
+async def sync_server_time(client):
+    """Set the offset of the local clock to the futures server time, used in the timestamp of signed requests."""
+    sent = time.time()
+    server_time = (await client.futures_time())['serverTime']
+    client.timestamp_offset = server_time - int((sent + time.time()) * 500)  # Server time is from mid-flight
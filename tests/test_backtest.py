@@ -0,0 +1,13 @@
+import numpy as np
+from async_trading_bot.backtest import candle_index
+from async_trading_bot.utils import MINUTE_MS
+
+MONDAY = 1704067200000  # 2024-01-01 00:00 UTC
+
+
+def test_weekly_candles_open_on_monday():
+    # Hourly bars from Sunday 22:00 to Tuesday 00:00, the weekly candle changes at Monday 00:00
+    open_time = MONDAY + np.arange(-2, 25, dtype=np.int64) * 60 * MINUTE_MS
+    last_bar, candle_of_bar = candle_index(open_time, '1w')
+    assert last_bar.tolist() == [1, 26]
+    assert candle_of_bar.tolist() == [0, 0] + [1] * 25
@@ -0,0 +1,63 @@
+import numpy as np
+import talib
+from async_trading_bot.indicators import EmaEngine
+
+SHORT, LONG = 9, 26
+MINUTE = 60_000
+
+
+def _closes(n, seed=1):
+    return 100 + np.cumsum(np.random.default_rng(seed).normal(0, 0.5, n))
+
+
+def _klines(closes):
+    return [[i * MINUTE, 0, 0, 0, str(close)] for i, close in enumerate(closes)]
+
+
+def _assert_talib(engine, closes):
+    closes = np.asarray(closes, dtype=float)
+    short, long_ = engine.values()
+    assert np.isclose(short, talib.EMA(closes, SHORT)[-1], rtol=1e-12, atol=0)
+    assert np.isclose(long_, talib.EMA(closes, LONG)[-1], rtol=1e-12, atol=0)
+
+
+def test_seed_keeps_the_last_kline_provisional():
+    closes = _closes(200)
+    engine = EmaEngine(SHORT, LONG)
+    engine.seed(_klines(closes))
+    assert engine.last_closed_time == 198 * MINUTE
+    _assert_talib(engine, closes)
+
+
+def test_seed_with_fewer_klines_than_the_period_is_not_ready():
+    engine = EmaEngine(SHORT, LONG)
+    engine.seed(_klines(_closes(LONG - 1)))
+    assert not engine.ready
+
+
+def test_open_candle_updates_and_close():
+    closes = list(_closes(100))
+    engine = EmaEngine(SHORT, LONG)
+    engine.seed_closed(np.arange(100) * MINUTE, np.array(closes))
+    _assert_talib(engine, closes)
+    open_time = 100 * MINUTE
+    for price in (closes[-1] + 1, closes[-1] - 2, closes[-1] + 0.5):
+        engine.on_kline(open_time, price, False)
+        _assert_talib(engine, closes + [price])  # Provisional, the committed state is unchanged
+    engine.on_kline(open_time, closes[-1] + 0.25, True)
+    closes.append(closes[-1] + 0.25)
+    _assert_talib(engine, closes)
+    engine.on_kline(open_time, 1.0, False)  # Late update of a committed candle is ignored
+    _assert_talib(engine, closes)
+
+
+def test_missed_close_commits_the_last_known_close():
+    closes = list(_closes(100))
+    engine = EmaEngine(SHORT, LONG)
+    engine.seed(_klines(closes))
+    last_known = closes[-1] + 3
+    engine.on_kline(99 * MINUTE, last_known, False)
+    engine.on_kline(100 * MINUTE, last_known - 1, False)  # The close message of the candle at 99 was missed
+    assert engine.last_closed_time == 99 * MINUTE
+    _assert_talib(engine, closes[:-1] + [last_known, last_known - 1])
+
@@ -0,0 +1,131 @@
+import asyncio
+import pytest
+from async_trading_bot.journal import ACCOUNT_TRADES_LIMIT, ACCOUNT_TRADES_WINDOW, Ledger, TradeJournal, read_events
+from async_trading_bot.user_stream import AccountState
+
+SYMBOL = 'BTCUSDT'
+NOW = 1_700_000_000_000
+
+
+def _trade(trade_id, side, quantity, price, time_, fee=0.0):
+    return {'id': trade_id, 'orderId': trade_id, 'side': side, 'qty': str(quantity), 'price': str(price),
+            'commission': str(fee), 'commissionAsset': 'USDT', 'time': time_}
+
+
+def _order_event(trade, asset='USDT'):
+    return {'s': SYMBOL, 'x': 'TRADE', 'S': trade['side'], 'l': trade['qty'], 'L': trade['price'],
+            'n': trade['commission'], 'N': asset, 'i': trade['orderId'], 't': trade['id'], 'T': trade['time']}
+
+
+def _snapshot(amount, entry_price, update_time):
+    account = AccountState()
+    account.reconcile({'assets': [], 'positions': [{'symbol': SYMBOL, 'positionSide': 'BOTH',
+                                                    'positionAmt': str(amount), 'entryPrice': str(entry_price),
+                                                    'updateTime': update_time}]}, [], NOW)
+    return account
+
+
+class FakeClient:
+    timestamp_offset = 0
+
+    def __init__(self, trades):
+        self.trades = trades
+        self.requests = []
+
+    async def futures_account_trades(self, symbol, limit, startTime=None, endTime=None, fromId=None):
+        self.requests.append((startTime, endTime, fromId))
+        if fromId is not None:
+            trades = [trade for trade in self.trades if trade['id'] >= fromId]
+        else:
+            assert endTime - startTime < ACCOUNT_TRADES_WINDOW
+            trades = [trade for trade in self.trades if startTime <= trade['time'] <= endTime]
+        return trades[:limit]
+
+
+def test_average_cost_pnl_and_flip():
+    ledger = Ledger()
+    ledger.record_fill(SYMBOL, 'BUY', 1, 100, 0.1, 'USDT', 1, 1, NOW)
+    ledger.record_fill(SYMBOL, 'BUY', 1, 110, 0.1, 'USDT', 2, 2, NOW + 1)
+    assert ledger.summary(SYMBOL)['entry_price'] == 105
+    ledger.record_fill(SYMBOL, 'SELL', 3, 120, 0.3, 'USDT', 3, 3, NOW + 2)
+    ledger.record_fill(SYMBOL, 'BUY', 1, 119, 0.001, 'BNB', 4, 4, NOW + 3)  # Closes the flipped short
+    summary = ledger.summary(SYMBOL, price=130)
+    assert summary['amount'] == 0
+    assert summary['realized'] == pytest.approx(2 * 15 + 1)
+    assert summary['fees'] == pytest.approx(0.5)
+    assert summary['other_fees'] == {'BNB': 0.001}
+    assert summary['net'] == pytest.approx(31 - 0.5)
+    assert summary['unrealized'] == 0
+
+
+def test_funding_is_booked_on_the_only_open_position():
+    ledger = Ledger()
+    ledger.record_fill(SYMBOL, 'SELL', 2, 100, 0.0, 'USDT', 1, 1, NOW)
+    ledger.on_account_update({'m': 'FUNDING_FEE', 'B': [{'a': 'USDT', 'bc': '-0.25'}]})
+    summary = ledger.summary(SYMBOL, price=90)
+    assert summary['funding'] == -0.25
+    assert summary['unrealized'] == 20
+    assert summary['net_with_unrealized'] == pytest.approx(19.75)
+
+
+def test_a_fill_seen_on_the_stream_and_in_the_trade_list_counts_once():
+    ledger = Ledger()
+    trade = _trade(7, 'BUY', 0.5, 100, NOW)
+    ledger.on_order_update(_order_event(trade))
+    asyncio.run(ledger.catch_up(FakeClient([trade]), [SYMBOL], end_time=NOW + 1))
+    ledger.on_order_update(_order_event(trade))
+    assert ledger.summary(SYMBOL)['amount'] == 0.5
+
+
+def test_journal_replay_rebuilds_the_ledger_and_its_dedupe(tmp_path):
+    async def run():
+        ledger = Ledger(TradeJournal(str(tmp_path)))
+        ledger.record_fill(SYMBOL, 'BUY', 1, 100, 0.1, 'USDT', 1, 1, NOW)
+        ledger.record_fill(SYMBOL, 'SELL', 0.4, 110, 0.1, 'USDT', 2, 2, NOW + 1)
+        await ledger.journal.close()
+        rebuilt = Ledger(TradeJournal(str(tmp_path)))
+        await rebuilt.load()
+        rebuilt.record_fill(SYMBOL, 'SELL', 0.4, 110, 0.1, 'USDT', 2, 2, NOW + 1)
+        return ledger, rebuilt
+
+    ledger, rebuilt = asyncio.run(run())
+    assert rebuilt.summary(SYMBOL) == ledger.summary(SYMBOL)
+    assert [event['type'] for event in read_events(str(tmp_path))] == ['fill', 'fill']
+
+
+def test_catch_up_pages_by_window_and_trade_id():
+    day = 24 * 3600 * 1000
+    # More trades in one millisecond than one page holds, then some spread over several weeks
+    trades = [_trade(i, 'BUY', 1, 100, NOW) for i in range(ACCOUNT_TRADES_LIMIT * 2 + 500)]
+    trades += [_trade(len(trades) + i, 'BUY', 1, 100, NOW + (i + 1) * 3 * day) for i in range(10)]
+    ledger = Ledger()
+    ledger.state(SYMBOL)['last_trade_time'] = NOW
+    asyncio.run(ledger.catch_up(FakeClient(trades), [SYMBOL], end_time=NOW + 40 * day))
+    assert ledger.summary(SYMBOL)['amount'] == len(trades)
+
+
+def test_sync_keeps_a_fill_made_after_the_snapshot():
+    # The first entry right after startup: not in the snapshot, booked from the trade list and the stream
+    ledger = Ledger()
+    trade = _trade(1, 'SELL', 0.024, 100, NOW - 1)
+    account = _snapshot(0, 0, 0)
+    asyncio.run(ledger.sync(FakeClient([trade]), [SYMBOL], account, NOW))
+    ledger.on_order_update(_order_event(trade))
+    assert ledger.summary(SYMBOL)['amount'] == -0.024
+
+
+def test_sync_adopts_a_fill_already_in_the_snapshot_once():
+    ledger = Ledger()
+    trade = _trade(1, 'BUY', 1, 100, NOW - 10)
+    account = _snapshot(1, 100, NOW - 10)
+    asyncio.run(ledger.sync(FakeClient([trade]), [SYMBOL], account, NOW))
+    ledger.on_order_update(_order_event(trade))  # Replayed by the stream, it is within the tolerance
+    assert ledger.summary(SYMBOL)['amount'] == 1
+
+
+def test_sync_adopts_the_snapshot_position_of_an_unknown_history():
+    ledger = Ledger()
+    account = _snapshot(-2, 50, NOW - 3_600_000)
+    asyncio.run(ledger.sync(FakeClient([]), [SYMBOL], account, NOW))
+    summary = ledger.summary(SYMBOL)
+    assert (summary['amount'], summary['entry_price']) == (-2, 50)
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+import talib
+from async_trading_bot.backtest import KLINE_COLUMNS
+from async_trading_bot.indicators import EmaEngine
+from async_trading_bot.optimizer import (PARAMETERS, ema_matrix, optimize, run_key, to_config, walk_forward,
+                                         walk_forward_windows)
+
+BASE_CONFIG = {'symbol': 'BTCUSDT', 'symbols': ['BTCUSDT', 'ETHUSDT'], 'short_ema_period': 9, 'long_ema_period': 26,
+               'ema_interval': '5m', 'leverage': 3, 'order_size': 5, 'risk_percentage': 0.02,
+               'price_increase_trigger': 0.04}
+
+
+def _closes(n, seed=2):
+    return 100 + np.cumsum(np.random.default_rng(seed).normal(0, 0.5, n))
+
+
+def _klines(n):
+    close = _closes(n, seed=3)
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    klines = {'open_time': np.arange(n, dtype=np.int64) * 60_000, 'open': open_,
+              'high': np.maximum(open_, close) + 0.1, 'low': np.minimum(open_, close) - 0.1, 'close': close}
+    return {column: klines[column] for column in KLINE_COLUMNS}
+
+
+def _row(symbol, short, train, test):
+    params = {**{name: BASE_CONFIG[name] for name in PARAMETERS}, 'short_ema_period': short}
+    return {'symbol': symbol, **params, 'train_return': float(np.mean(train)),
+            'folds': [{'train_return': a, 'test_return': b} for a, b in zip(train, test)]}
+
+
+def test_ema_matrix_matches_talib_and_streaming():
+    closes = _closes(500)
+    periods = [5, 9, 21, 26, 50]
+    matrix = ema_matrix(closes, periods)
+    for column, period in enumerate(periods):
+        expected = talib.EMA(closes, period)
+        assert np.array_equal(np.isnan(matrix[:, column]), np.isnan(expected))
+        assert np.allclose(matrix[:, column], expected, rtol=1e-12, atol=0, equal_nan=True)
+    engine = EmaEngine(9, 26)
+    engine.seed_closed(np.arange(len(closes)) * 60_000, closes)
+    assert engine.values() == (matrix[-1, 1], matrix[-1, 3])
+
+
+def test_walk_forward_reports_the_train_pick_on_the_next_window():
+    # Combination 5 wins every train window but loses out of sample, 12 is the reverse
+    rows = [_row('BTCUSDT', 5, train=[0.3, 0.2], test=[-0.1, -0.2]),
+            _row('BTCUSDT', 12, train=[0.1, 0.0], test=[0.4, 0.3])]
+    result, = walk_forward(rows)
+    assert [pick['short_ema_period'] for pick in result['picks']] == [5, 5]
+    assert result['test_return'] == pytest.approx(-0.15)
+
+
+def test_walk_forward_ranks_symbols_on_their_picks():
+    rows = [_row('BTCUSDT', 5, [0.3], [-0.1]), _row('BTCUSDT', 12, [0.1], [0.5]),
+            _row('ETHUSDT', 5, [0.1], [0.2]), _row('ETHUSDT', 12, [0.2], [0.1])]
+    assert [(result['symbol'], result['test_return']) for result in walk_forward(rows)] == \
+        [('ETHUSDT', 0.1), ('BTCUSDT', -0.1)]
+
+
+def test_run_key_covers_folds_costs_and_base_config():
+    windows = walk_forward_windows(1000, 2)
+    key = run_key(BASE_CONFIG, windows, 0.0004, 0.0001)
+    assert key == run_key({**BASE_CONFIG, 'short_ema_period': 5}, windows, 0.0004, 0.0001)  # A grid parameter
+    assert key != run_key(BASE_CONFIG, walk_forward_windows(1000, 3), 0.0004, 0.0001)
+    assert key != run_key(BASE_CONFIG, walk_forward_windows(1200, 2), 0.0004, 0.0001)
+    assert key != run_key(BASE_CONFIG, windows, 0.0005, 0.0001)
+    assert key != run_key(BASE_CONFIG, windows, 0.0004, 0.0002)
+    assert key != run_key({**BASE_CONFIG, 'leverage': 5}, windows, 0.0004, 0.0001)
+
+
+def test_to_config_trades_only_the_optimized_symbol():
+    config = to_config({**_row('ETHUSDT', 12, [0.1], [0.1])}, BASE_CONFIG)
+    assert config['symbol'] == 'ETHUSDT' and 'symbols' not in config
+    assert config['short_ema_period'] == 12 and config['leverage'] == 3
+
+
+def test_checkpoint_is_only_resumed_with_the_same_settings(tmp_path):
+    klines = {'BTCUSDT': _klines(3000)}
+    grid = {'short_ema_period': [5, 9], 'long_ema_period': [21]}
+    checkpoint = str(tmp_path / 'sweep.jsonl')
+    rows = optimize(klines, grid, BASE_CONFIG, folds=2, workers=1, checkpoint=checkpoint)
+    assert len(rows) == 2 and all(len(row['folds']) == 2 for row in rows)
+    resumed = optimize(klines, grid, BASE_CONFIG, folds=2, workers=1, checkpoint=checkpoint)
+    assert resumed == rows
+    other = optimize(klines, grid, BASE_CONFIG, folds=3, workers=1, checkpoint=checkpoint)
+    assert len(other) == 2 and all(len(row['folds']) == 3 for row in other)
@@ -0,0 +1,44 @@
+import asyncio
+import json
+import pytest
+from async_trading_bot.rate_limiter import RequestScheduler, order_count
+
+
+class FakeClient:
+    async def futures_create_order(self, **params):
+        return {'orderId': 1}
+
+    async def futures_place_batch_order(self, **params):
+        return [{'orderId': i} for i, _ in enumerate(params['batchOrders'])]
+
+    async def futures_cancel_order(self, **params):
+        return {'orderId': params['orderId']}
+
+    async def futures_cancel_orders(self, **params):
+        return [{'orderId': order_id} for order_id in json.loads(params['orderIdList'])]
+
+
+def test_order_count():
+    assert order_count('futures_create_order', {'symbol': 'BTCUSDT'}) == 1
+    assert order_count('futures_place_batch_order', {'batchOrders': [{}, {}, {}]}) == 3
+    assert order_count('futures_place_batch_order', {'batchOrders': json.dumps([{}, {}])}) == 2
+    assert order_count('futures_cancel_order', {'orderId': 1}) == 0
+    assert order_count('futures_cancel_orders', {'orderIdList': json.dumps([1, 2, 3])}) == 0
+    assert order_count('futures_klines', {'symbol': 'BTCUSDT'}) == 0
+
+
+def test_only_new_orders_take_order_tokens():
+    async def run():
+        scheduler = RequestScheduler(FakeClient())
+        full = scheduler.orders_10s.tokens
+        await scheduler.futures_cancel_order(symbol='BTCUSDT', orderId=1)
+        await scheduler.futures_cancel_orders(symbol='BTCUSDT', orderIdList=json.dumps([1, 2, 3]))
+        after_cancels = scheduler.orders_10s.tokens
+        await scheduler.futures_place_batch_order(batchOrders=[{}, {}, {}, {}])
+        await scheduler.futures_create_order(symbol='BTCUSDT')
+        return full, after_cancels, scheduler.orders_10s.tokens, scheduler.orders_1m.tokens
+
+    full, after_cancels, after_orders, after_orders_1m = asyncio.run(run())
+    assert after_cancels == pytest.approx(full, abs=0.1)
+    assert full - after_orders == pytest.approx(5, abs=0.1)
+    assert 1200 - after_orders_1m == pytest.approx(5, abs=0.1)
@@ -0,0 +1,37 @@
+import asyncio
+import pytest
+from async_trading_bot.symbol_info import SymbolInfo, SymbolMetadataCache
+from async_trading_bot.trade_bot import TradingBot
+
+CONFIG = {'symbol': 'BTCUSDT', 'short_ema_period': 9, 'long_ema_period': 26, 'ema_interval': '1h', 'leverage': 3,
+          'order_size': 5, 'risk_percentage': 0.02, 'price_increase_trigger': 0.04}
+
+
+def _bot(balance, price, min_notional='100', max_market_qty='120'):
+    bot = TradingBot('key', 'secret', CONFIG)
+    bot.symbol_metadata = SymbolMetadataCache(None)
+    bot.symbol_metadata.symbols['BTCUSDT'] = SymbolInfo({'symbol': 'BTCUSDT', 'filters': [
+        {'filterType': 'LOT_SIZE', 'stepSize': '0.001', 'minQty': '0.001', 'maxQty': '1000'},
+        {'filterType': 'MARKET_LOT_SIZE', 'stepSize': '0.001', 'minQty': '0.001', 'maxQty': max_market_qty},
+        {'filterType': 'PRICE_FILTER', 'tickSize': '0.10'},
+        {'filterType': 'MIN_NOTIONAL', 'notional': min_notional}]})
+    bot.account.reconcile({'assets': [{'asset': 'USDT', 'walletBalance': str(balance)}], 'positions': []}, [], 0)
+
+    async def latest_price():
+        return price
+    bot.get_latest_price = latest_price
+    return bot
+
+
+def test_quantity_is_rounded_down_to_the_step():
+    assert asyncio.run(_bot(10000, 30000).calculate_quantity(50)) == '0.166'
+
+
+def test_an_order_below_the_minimum_notional_is_rejected():
+    # 5% of 1000 USDT is 50 USDT, below the 100 USDT minimum
+    with pytest.raises(ValueError, match='minimum notional'):
+        asyncio.run(_bot(1000, 30000).calculate_quantity(5))
+
+
+def test_a_market_order_above_the_maximum_quantity_is_clamped():
+    assert asyncio.run(_bot(1_000_000, 1, max_market_qty='120').calculate_quantity(50)) == '120.000'
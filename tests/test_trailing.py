@@ -0,0 +1,166 @@
+import asyncio
+import time
+import pytest
+from binance.exceptions import BinanceAPIException
+from async_trading_bot.journal import TradeJournal
+from async_trading_bot.trailing import TRIGGER_STEP, TrailingStopManager
+from async_trading_bot.user_stream import AccountState
+
+SYMBOL = 'BTCUSDT'
+
+
+class FakeSymbolInfo:
+    def round_quantity(self, quantity):
+        return f"{quantity:.3f}"
+
+    def round_price(self, price):
+        return round(price, 2)
+
+
+class FakeClient:
+    def __init__(self):
+        self.orders = []
+        self.cancelled = []
+
+    async def futures_create_order(self, **params):
+        self.orders.append(params)
+        return {'orderId': 100 + len(self.orders), 'activatePrice': params.get('activationPrice')}
+
+    async def futures_cancel_order(self, symbol, orderId):
+        self.cancelled.append(orderId)
+
+
+class FakeBot:
+    symbol = SYMBOL
+    price_increase_trigger = 0.04
+    risk_percentage = 0.02
+    symbol_info = FakeSymbolInfo()
+
+    def __init__(self, position_amount=1.0, error=None):
+        self.account = AccountState()
+        self.journal = TradeJournal(None)
+        self.client = FakeClient()
+        self.position_amount = position_amount
+        self.error = error
+        self.moves = []
+        self.stop_loss_price = None
+
+    async def get_position_amount(self):
+        return self.position_amount
+
+    async def adjust_stop_loss_on_exchange(self, new_stop, position_size, old_order_id):
+        self.moves.append(new_stop)
+        if self.error:
+            raise self.error
+        return {'stopPrice': str(new_stop), 'orderId': old_order_id + 1}
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def _started(bot, mode='local', debounce=0.01, side='BUY', position_size=1.0):
+    trailing = TrailingStopManager(bot, mode, debounce)
+    await trailing.start(side, 100.0, {'stopPrice': '98', 'orderId': 1}, position_size)
+    return trailing
+
+
+def test_the_stop_moves_once_per_trigger_and_only_in_favour():
+    async def run():
+        bot = FakeBot()
+        trailing = await _started(bot)
+        await trailing.on_price(103.9)
+        assert trailing._task is None
+        await trailing.on_price(104)
+        await trailing._task
+        assert bot.moves == [pytest.approx(104 * 0.98)]
+        assert trailing.stop_price == pytest.approx(104 * 0.98) and trailing.stop_order_id == 2
+        assert trailing.next_trigger_price == pytest.approx(100 * (1 + 0.04 + TRIGGER_STEP))
+        await trailing.on_price(111)
+        await trailing._task
+        assert bot.moves[-1] == pytest.approx(111 * 0.98)
+        return trailing
+
+    assert _run(run()).moves == 2
+
+
+def test_short_stop_moves_down():
+    async def run():
+        bot = FakeBot(position_amount=-1.0)
+        trailing = await _started(bot, side='SELL')
+        await trailing.on_price(96)
+        await trailing._task
+        return bot
+
+    assert _run(run()).moves == [pytest.approx(96 * 1.02)]
+
+
+def test_a_rejected_move_waits_for_the_next_trigger():
+    async def run():
+        error = BinanceAPIException(None, 400, '{"code": -2021, "msg": "Order would immediately trigger."}')
+        bot = FakeBot(error=error)
+        trailing = await _started(bot)
+        await trailing.on_price(104)
+        await trailing._task
+        await asyncio.sleep(0.05)
+        assert len(bot.moves) == 1 and trailing.pending_stop is None and trailing.stop_order_id == 1
+        bot.error = None
+        await trailing.on_price(111)
+        await trailing._task
+        return bot
+
+    assert len(_run(run()).moves) == 2
+
+
+def test_a_failed_request_is_retried():
+    async def run():
+        bot = FakeBot(error=asyncio.TimeoutError())
+        trailing = await _started(bot)
+        await trailing.on_price(104)
+        await asyncio.sleep(0.005)
+        bot.error = None
+        await trailing._task
+        return bot
+
+    moves = _run(run()).moves
+    assert len(moves) == 2 and moves[0] == moves[1]
+
+
+def test_halt_drops_a_move_waiting_for_the_debounce():
+    async def run():
+        bot = FakeBot()
+        trailing = await _started(bot, debounce=10)
+        trailing.last_move = time.monotonic()  # A move just happened
+        await trailing.on_price(104)
+        await trailing.halt()
+        return bot, trailing
+
+    bot, trailing = _run(run())
+    assert bot.moves == [] and not trailing.active and trailing._task is None
+
+
+def test_native_order_is_sized_from_the_confirmed_fill():
+    async def run():
+        bot = FakeBot(position_amount=0.0)  # The account book has not seen the fill yet
+        trailing = await _started(bot, mode='native', position_size=0.5)
+        return bot, trailing
+
+    bot, trailing = _run(run())
+    assert trailing.native
+    assert bot.client.orders[0]['type'] == 'TRAILING_STOP_MARKET'
+    assert bot.client.orders[0]['quantity'] == '0.500'
+
+
+def test_a_filled_stop_cancels_the_trailing_order():
+    async def run():
+        bot = FakeBot()
+        trailing = await _started(bot, mode='native')
+        trailing_order_id = trailing.trailing_order_id
+        bot.account._on_order_update({'s': SYMBOL, 'c': 'c', 'S': 'SELL', 'o': 'STOP_MARKET', 'q': '1', 'sp': '98',
+                                      'ps': 'BOTH', 'X': 'FILLED', 'x': 'TRADE', 'i': 1, 'ap': '98', 'z': '1'})
+        await trailing._cleanup
+        return bot, trailing, trailing_order_id
+
+    bot, trailing, trailing_order_id = _run(run())
+    assert not trailing.active
+    assert bot.client.cancelled == [trailing_order_id]
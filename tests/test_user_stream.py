@@ -0,0 +1,49 @@
+from async_trading_bot.user_stream import SNAPSHOT_TOLERANCE_MS, AccountState
+
+SNAPSHOT_TIME = 1_700_000_000_000
+
+
+def _account():
+    account = AccountState()
+    account.reconcile({'assets': [{'asset': 'USDT', 'walletBalance': '1000'}],
+                       'positions': [{'symbol': 'BTCUSDT', 'positionSide': 'BOTH', 'positionAmt': '0',
+                                      'entryPrice': '0'}]}, [], SNAPSHOT_TIME)
+    return account
+
+
+def _order_event(event_time, order_id=1):
+    return {'e': 'ORDER_TRADE_UPDATE', 'E': event_time, 'T': event_time,
+            'o': {'s': 'BTCUSDT', 'c': 'c1', 'S': 'BUY', 'o': 'MARKET', 'q': '0.01', 'sp': '0', 'x': 'TRADE',
+                  'X': 'FILLED', 'i': order_id, 'l': '0.01', 'z': '0.01', 'L': '50000', 'ap': '50000', 'n': '0.2',
+                  'N': 'USDT', 't': 7, 'T': event_time, 'ps': 'BOTH'}}
+
+
+def _account_event(event_time, amount):
+    return {'e': 'ACCOUNT_UPDATE', 'E': event_time, 'T': event_time,
+            'a': {'m': 'ORDER', 'B': [{'a': 'USDT', 'wb': '999.8', 'cw': '999.8', 'bc': '0'}],
+                  'P': [{'s': 'BTCUSDT', 'pa': amount, 'ep': '50000', 'up': '0', 'ps': 'BOTH'}]}}
+
+
+def test_events_just_before_the_snapshot_time_are_applied():
+    # The snapshot time is an estimate of the server clock, a fill made after the snapshot can carry an
+    # event time slightly before it
+    account = _account()
+    orders = []
+    account.order_listeners.append(orders.append)
+    account.on_event(_order_event(SNAPSHOT_TIME - 1))
+    account.on_event(_account_event(SNAPSHOT_TIME - 1, '0.01'))
+    assert [order['i'] for order in orders] == [1]
+    assert account.fills[1] == (50000.0, 0.01)
+    assert account.position_amount('BTCUSDT') == 0.01
+    assert account.balance('USDT') == 999.8
+
+
+def test_events_older_than_the_tolerance_are_ignored():
+    account = _account()
+    orders = []
+    account.order_listeners.append(orders.append)
+    account.on_event(_order_event(SNAPSHOT_TIME - SNAPSHOT_TOLERANCE_MS - 1))
+    account.on_event(_account_event(SNAPSHOT_TIME - SNAPSHOT_TOLERANCE_MS - 1, '0.01'))
+    assert orders == []
+    assert account.position_amount('BTCUSDT') == 0
+    assert account.balance('USDT') == 1000